@@ -1,16 +1,30 @@
 from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
-from helpers import get_model, parse_entity_types, store_training_text
+from datetime import date
+from helpers import get_model, release_model, parse_entity_types
+from batching import get_batcher
+from chunking import predict_windowed
+from inference_executor import get_inference_executor
+from prediction_cache import get_prediction_cache
+from model_registry import get_model_registry
 from custom_types import EntityRequest
 import constants
 from utils import get_keycloak_admin_token, assign_role_to_user, get_user_from_token
-from daily_usage import get_user_usage_today, increment_user_usage, cleanup_old_usage_records
+from auth import get_token_verifier
+from keycloak_admin import get_keycloak_admin_client
+from daily_usage import cleanup_old_usage_records
+from usage_meter import reserve_usage, refund_usage, get_usage_meter
 from experiments import router as experiments_router
 from documents import router as documents_router
 from experiment_runs import router as experiment_runs_router
 from daily_usage import router as daily_usage_router
 from subscriptions import router as subscriptions_router
+from experiment_jobs import router as experiment_jobs_router, get_job_workers
+from document_import import router as document_import_router
+from run_analytics import router as run_analytics_router
+from training_capture import get_training_capture
+from mongo import get_mongo_store
 
 app = FastAPI()
 
@@ -18,7 +32,7 @@ async def cleanup_task():
     """Background task to clean up old usage records"""
     while True:
         try:
-            deleted_count = cleanup_old_usage_records()
+            deleted_count = await cleanup_old_usage_records()
             print(f"Cleaned up {deleted_count} old usage records")
         except Exception as e:
             print(f"Error during cleanup: {e}")
@@ -27,13 +41,37 @@ async def cleanup_task():
 
 @app.on_event("startup")
 async def startup_event():
+    try:
+        await get_mongo_store().ensure_indexes()
+    except Exception as e:
+        print(f"Could not ensure Mongo indexes: {e}")
+    await get_token_verifier().start()
     asyncio.create_task(cleanup_task())
+    asyncio.create_task(get_model_registry().preload(constants.PRELOAD_MODELS))
+    get_job_workers().start()
+    get_training_capture().start()
+    if constants.USAGE_METER_ENABLED:
+        asyncio.create_task(get_usage_meter().run())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_job_workers().stop()
+    await get_token_verifier().stop()
+    await get_training_capture().stop()
+    if constants.USAGE_METER_ENABLED:
+        await get_usage_meter().flush()
+    await get_keycloak_admin_client().close()
+    await get_mongo_store().close()
+    await get_inference_executor().shutdown()
 
 app.include_router(experiments_router)
 app.include_router(documents_router)
 app.include_router(experiment_runs_router)
 app.include_router(daily_usage_router)
 app.include_router(subscriptions_router)
+app.include_router(experiment_jobs_router)
+app.include_router(document_import_router)
+app.include_router(run_analytics_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -54,21 +92,81 @@ async def get_user(request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get user details: {str(e)}")
 
+async def extract_entities(req: EntityRequest) -> list:
+    try:
+        entity_types = parse_entity_types(req.entity_types)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache = get_prediction_cache()
+    cache_key = cache.make_key(req.model, req.text, entity_types, req.threshold, req.allow_multi_labeling)
+    entities = await cache.get(cache_key)
+
+    if entities is None:
+        try:
+            model = await get_model(req.model)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to load model: {e}")
+
+        try:
+            if model == "gemini":
+                from gemini_client import get_gemini_client
+                gemini_client = get_gemini_client()
+                entities = await gemini_client.predict_entities(
+                    req.text,
+                    entity_types,
+                    threshold=req.threshold,
+                    multi_label=req.allow_multi_labeling,
+                )
+            else:
+                batcher = get_batcher()
+                entities = (await predict_windowed(
+                    [req.text],
+                    lambda window_texts: asyncio.gather(*(
+                        batcher.predict_entities(
+                            req.model,
+                            model,
+                            window,
+                            entity_types,
+                            threshold=req.threshold,
+                            multi_label=req.allow_multi_labeling,
+                        )
+                        for window in window_texts
+                    )),
+                    req.allow_multi_labeling,
+                ))[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Inference error: {e}")
+        finally:
+            release_model(req.model)
+
+        await cache.set(cache_key, entities)
+
+    return entities
+
 @app.post("/predict_entities")
 async def predict_entities(req: EntityRequest, request: Request):
+    usage_date = None
     try:
         user_details = get_user_from_token(request)
         user_id = user_details["id"]
         user_roles = user_details.get("roles", [])
         
         if "premium_user" not in user_roles:
-            daily_limit = 5
-            used_today = get_user_usage_today(user_id)
+            daily_limit = constants.FREE_DAILY_LIMIT
+            usage_date = date.today()
             
-            if used_today >= daily_limit:
+            if await reserve_usage(user_id, daily_limit, usage_date) is None:
                 raise HTTPException(
                     status_code=429, 
-                    detail=f"Daily limit reached. You have used {used_today}/{daily_limit} extractions today. Upgrade to Premium for unlimited access."
+                    detail=f"Daily limit reached. You have used {daily_limit}/{daily_limit} extractions today. Upgrade to Premium for unlimited access."
                 )
     except HTTPException:
         raise
@@ -76,45 +174,15 @@ async def predict_entities(req: EntityRequest, request: Request):
         raise HTTPException(status_code=500, detail=f"Failed to check usage limits: {str(e)}")
 
     try:
-        entity_types = parse_entity_types(req.entity_types)
-    except HTTPException:
+        entities = await extract_entities(req)
+    except (Exception, asyncio.CancelledError):
+        # A failed or abandoned extraction does not count against the daily limit
+        if usage_date is not None:
+            await refund_usage(user_id, usage_date)
         raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    try:
-        model = get_model(req.model)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to load model: {e}")
-
-    try:
-        if model == "gemini":
-            from gemini_client import get_gemini_client
-            gemini_client = get_gemini_client()
-            entities = await gemini_client.predict_entities(
-                req.text,
-                entity_types,
-                threshold=req.threshold,
-                multi_label=req.allow_multi_labeling,
-            )
-        else:
-            entities = model.predict_entities(
-                req.text,
-                entity_types,
-                threshold=req.threshold,
-                multi_label=req.allow_multi_labeling,
-            )
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Inference error: {e}")
 
     if req.allowTrainingUse:
-        store_training_text(req.text)
-
-    if "premium_user" not in user_roles:
-        increment_user_usage(user_id)
+        get_training_capture().submit(req.text)
 
     return entities
 
@@ -125,7 +193,7 @@ async def subscribe(request: Request):
         user_details = get_user_from_token(request)
         user_id = user_details["id"]
         
-        result = assign_role_to_user(user_id, "premium_user")
+        result = await assign_role_to_user(user_id, "premium_user")
         
         return {
             "message": "premium_user role assigned successfully",
@@ -189,19 +257,19 @@ async def regular_content(request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get regular content: {str(e)}")
 
-@app.post("/cleanup-usage")
-async def cleanup_usage():
-    """Cleanup usage records from previous day (for admin/scheduled tasks)"""
-    try:
-        deleted_count = cleanup_old_usage_records()
-        return {
-            "message": f"Cleaned up {deleted_count} usage records from previous day",
-            "deleted_count": deleted_count
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to cleanup usage records: {str(e)}")
-    
+@app.get("/prediction-cache/stats")
+async def prediction_cache_stats():
+    """Hit and miss counters of the prediction cache"""
+    return get_prediction_cache().stats()
+
 @app.get("/")
 async def health():
     return {"status": "online"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: only succeeds once the preloaded models are loaded and warmed up"""
+    if not get_model_registry().ready:
+        raise HTTPException(status_code=503, detail="Models are still loading")
+    return {"status": "ready", "models": list(get_model_registry().models)}
+
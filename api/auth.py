@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import httpx
+import jwt
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from jwt import PyJWK, PyJWKSet
+from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
+
+load_dotenv()
+
+KEYCLOAK_SERVER_URL = os.getenv("KEYCLOAK_SERVER_URL")
+KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM")
+KEYCLOAK_JWKS_URL = os.getenv("KEYCLOAK_JWKS_URL", f"{KEYCLOAK_SERVER_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs")
+# A local JWKS file (e.g. written by fake_keycloak_server.py) used instead of fetching KEYCLOAK_JWKS_URL
+KEYCLOAK_JWKS_FILE = os.getenv("KEYCLOAK_JWKS_FILE")
+# Expected "iss" claim; not checked when unset, since the browser may reach Keycloak under another host name
+KEYCLOAK_ISSUER = os.getenv("KEYCLOAK_ISSUER")
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "3600"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# A token with an unknown key id triggers a refetch (keys were rotated), but at most this often
+JWKS_MIN_REFETCH_SECONDS = 10
+ALLOWED_ALGORITHMS = ["RS256", "RS384", "RS512", "PS256", "ES256"]
+
+class TokenVerifier:
+    """Verifies bearer tokens against the realm's signing keys.
+
+    The JWKS is loaded at startup and kept fresh by a background task (run), every JWKS_REFRESH_SECONDS
+    or, at most every JWKS_MIN_REFETCH_SECONDS, when a token names an unknown key; verifying a token
+    never waits on the network. Verified claims are memoized per token until the token expires, in an
+    LRU bounded to TOKEN_CACHE_SIZE entries, so repeated requests with the same token skip
+    signature verification entirely.
+    """
+
+    def __init__(self, jwks_url: str = KEYCLOAK_JWKS_URL, jwks_file: Optional[str] = KEYCLOAK_JWKS_FILE,
+                 refresh_seconds: int = JWKS_REFRESH_SECONDS, cache_size: int = TOKEN_CACHE_SIZE):
+        self.jwks_url = jwks_url
+        self.jwks_file = jwks_file
+        self.refresh_seconds = refresh_seconds
+        self.cache_size = cache_size
+        self.keys: Dict[str, PyJWK] = {}
+        self.fetched_at = 0.0
+        self.claims: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.refetch = asyncio.Event()
+        self.task = None
+
+    def _read_jwks_file(self) -> dict:
+        with open(self.jwks_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def refresh(self):
+        if self.jwks_file:
+            data = await asyncio.to_thread(self._read_jwks_file)
+        else:
+            async with httpx.AsyncClient(timeout=10) as client:
+                response = await client.get(self.jwks_url)
+                response.raise_for_status()
+                data = response.json()
+        key_set = PyJWKSet.from_dict(data)
+        self.keys = {key.key_id: key for key in key_set.keys}
+        self.fetched_at = time.monotonic()
+
+    async def _refresh_logged(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Failed to fetch token signing keys: {e}")
+
+    async def run(self):
+        """Refresh the keys every refresh_seconds, or sooner when a token named an unknown key."""
+        while True:
+            # Retry quickly while no keys could be loaded yet
+            timeout = self.refresh_seconds if self.keys else JWKS_MIN_REFETCH_SECONDS
+            try:
+                await asyncio.wait_for(self.refetch.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.refetch.clear()
+            await self._refresh_logged()
+            # Rate-limits refetches caused by unknown key ids, which anyone can put in a token
+            await asyncio.sleep(JWKS_MIN_REFETCH_SECONDS)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self._refresh_logged()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def get_signing_key(self, kid: str) -> PyJWK:
+        key = self.keys.get(kid)
+        if key is not None:
+            return key
+        if self.loop is not None:
+            # May be called from a worker thread by sync dependencies, so wake the refresher thread-safely
+            self.loop.call_soon_threadsafe(self.refetch.set)
+        if not self.keys:
+            raise HTTPException(status_code=503, detail="Token signing keys are not loaded yet")
+        raise HTTPException(status_code=401, detail="Token signed with an unknown key")
+
+    def verify(self, token: str) -> dict:
+        now = time.time()
+        with self.lock:
+            cached = self.claims.get(token)
+            if cached is not None and cached.get("exp", 0) > now:
+                self.claims.move_to_end(token)
+                return cached
+
+        try:
+            header = jwt.get_unverified_header(token)
+            key = self.get_signing_key(header.get("kid"))
+            claims = jwt.decode(
+                token,
+                key.key,
+                algorithms=ALLOWED_ALGORITHMS,
+                issuer=KEYCLOAK_ISSUER,
+                options={"verify_aud": False, "require": ["exp", "sub"]},
+            )
+        except ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        with self.lock:
+            self.claims[token] = claims
+            self.claims.move_to_end(token)
+            while len(self.claims) > self.cache_size:
+                self.claims.popitem(last=False)
+        return claims
+
+token_verifier = None
+
+def get_token_verifier() -> TokenVerifier:
+    global token_verifier
+    if token_verifier is None:
+        token_verifier = TokenVerifier()
+    return token_verifier
+
+def get_user_from_token(request: Request) -> dict:
+    """FastAPI dependency returning the authenticated user. The token is verified once per request."""
+    user_details = getattr(request.state, "user", None)
+    if user_details is not None:
+        return user_details
+
+    authorization = request.headers.get("Authorization")
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authorization header missing or invalid")
+    token = authorization.split(" ")[1]
+    try:
+        decoded_token = get_token_verifier().verify(token)
+        email = decoded_token.get("email")
+        if not email:
+            raise HTTPException(status_code=401, detail="Email address not found in token")
+        user_details = {
+            "email": email,
+            "username": decoded_token.get("preferred_username"),
+            "firstName": decoded_token.get("given_name"),
+            "lastName": decoded_token.get("family_name"),
+            "id": decoded_token.get("sub"),
+            "roles": decoded_token.get("realm_access", {}).get("roles", [])
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Token processing error: {str(e)}")
+
+    request.state.user = user_details
+    return user_details
+
+async def premium_user_required(request: Request):
+    user = get_user_from_token(request)
+    if "premium_user" not in user.get("roles", []):
+        raise HTTPException(status_code=403, detail="Premium user access required")
+    return user
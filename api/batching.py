@@ -0,0 +1,83 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from gliner import GLiNER
+import constants
+from helpers import run_gliner_batch
+from inference_executor import get_inference_executor
+
+BatchKey = Tuple[str, Tuple[str, ...], float, bool]
+
+@dataclass
+class PendingBatch:
+    model: GLiNER
+    texts: List[str] = field(default_factory=list)
+    futures: List[asyncio.Future] = field(default_factory=list)
+    timer: asyncio.TimerHandle = None
+
+class MicroBatcher:
+    """Groups concurrent GLiNER requests that share a model and label set into one forward pass."""
+
+    def __init__(self, max_batch_size: int = constants.BATCH_MAX_SIZE, max_wait_ms: float = constants.BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending: Dict[BatchKey, PendingBatch] = {}
+        self.running = set()
+
+    async def predict_entities(self, model_name: str, model: GLiNER, text: str, entity_types: List[str], threshold: float = 0.5, multi_label: bool = False) -> list:
+        loop = asyncio.get_running_loop()
+        key = (model_name, tuple(entity_types), threshold, multi_label)
+
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = PendingBatch(model=model)
+            batch.timer = loop.call_later(self.max_wait, self._flush, key)
+            self.pending[key] = batch
+
+        future = loop.create_future()
+        batch.texts.append(text)
+        batch.futures.append(future)
+
+        if len(batch.texts) >= self.max_batch_size:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: BatchKey):
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.create_task(self._run(key, batch))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def _run(self, key: BatchKey, batch: PendingBatch):
+        model_name, entity_types, threshold, multi_label = key
+        try:
+            results = await get_inference_executor().run(
+                model_name,
+                run_gliner_batch,
+                batch.model,
+                batch.texts,
+                list(entity_types),
+                threshold,
+                multi_label,
+            )
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, entities in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(entities)
+
+batcher = None
+
+def get_batcher() -> MicroBatcher:
+    global batcher
+    if batcher is None:
+        batcher = MicroBatcher()
+    return batcher
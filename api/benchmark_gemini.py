@@ -0,0 +1,37 @@
+"""Measure Gemini batch throughput against a local fake server, without touching the network.
+
+Usage:
+    FAKE_GEMINI_LATENCY_MS=200 uvicorn fake_gemini_server:app --port 8001
+    GEMINI_BASE_URL=http://localhost:8001 GEMINI_API_KEY=fake GEMINI_MAX_REQUESTS_PER_MINUTE=6000 python benchmark_gemini.py
+"""
+import asyncio
+import os
+import sys
+import time
+from gemini_client import GeminiClient
+
+NUM_TEXTS = int(os.getenv("BENCHMARK_NUM_TEXTS", "40"))
+ENTITY_TYPES = ["Disease", "Drug", "Symptom"]
+SAMPLE_TEXT = "Aspirin is commonly used to relieve headache and reduce the risk of stroke in adults."
+
+async def main():
+    if not os.getenv("GEMINI_BASE_URL"):
+        sys.exit("GEMINI_BASE_URL must point at the fake Gemini server")
+
+    client = GeminiClient()
+    texts = [f"{SAMPLE_TEXT} ({i})" for i in range(NUM_TEXTS)]
+
+    start = time.perf_counter()
+    for text in texts:
+        await client.predict_entities(text, ENTITY_TYPES)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await client.predict_entities_many(texts, ENTITY_TYPES)
+    concurrent = time.perf_counter() - start
+
+    print(f"Sequential: {NUM_TEXTS / sequential:.1f} texts/s ({sequential:.2f}s)")
+    print(f"Concurrent: {NUM_TEXTS / concurrent:.1f} texts/s ({concurrent:.2f}s)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
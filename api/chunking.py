@@ -0,0 +1,83 @@
+import re
+from typing import Awaitable, Callable, List, Optional, Tuple
+import constants
+from span_cache import greedy_decode
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+def _split_long_piece(text: str, start: int, end: int, window_chars: int) -> List[Tuple[int, int]]:
+    """Cut a piece longer than a window at the last whitespace before the limit, or hard if there is none."""
+    pieces = []
+    while end - start > window_chars:
+        cut = text.rfind(" ", start + 1, start + window_chars)
+        if cut == -1:
+            cut = start + window_chars
+        pieces.append((start, cut))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        pieces.append((start, end))
+    return pieces
+
+def _sentence_pieces(text: str, window_chars: int) -> List[Tuple[int, int]]:
+    pieces = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        if match.start() > start:
+            pieces.extend(_split_long_piece(text, start, match.start(), window_chars))
+        start = match.end()
+    if start < len(text):
+        pieces.extend(_split_long_piece(text, start, len(text), window_chars))
+    return pieces
+
+def split_into_windows(text: str, window_chars: int = constants.CHUNK_WINDOW_CHARS, overlap_chars: int = constants.CHUNK_OVERLAP_CHARS) -> List[Tuple[int, str]]:
+    """Split text into (offset, window) pairs made of whole sentences, with consecutive windows overlapping by up to overlap_chars."""
+    if len(text) <= window_chars:
+        return [(0, text)]
+
+    pieces = _sentence_pieces(text, window_chars)
+    windows = []
+    i = 0
+    while i < len(pieces):
+        j = i
+        while j + 1 < len(pieces) and pieces[j + 1][1] - pieces[i][0] <= window_chars:
+            j += 1
+        start, end = pieces[i][0], pieces[j][1]
+        windows.append((start, text[start:end]))
+        if j == len(pieces) - 1:
+            break
+
+        # The next window starts with the trailing sentences of this one that fit in the overlap
+        k = j + 1
+        while k - 1 > i and end - pieces[k - 1][0] <= overlap_chars:
+            k -= 1
+        i = k
+    return windows
+
+def merge_window_entities(windows: List[Tuple[int, str]], window_results: List[Optional[list]], multi_label: bool) -> list:
+    """Map window entities to document offsets and resolve duplicates and conflicts in the overlap regions."""
+    merged = {}
+    for (offset, _), entities in zip(windows, window_results):
+        for entity in entities or []:
+            entity = dict(entity, start=entity["start"] + offset, end=entity["end"] + offset)
+            key = (entity["start"], entity["end"], entity["label"])
+            if key not in merged or entity["score"] > merged[key]["score"]:
+                merged[key] = entity
+    return greedy_decode(list(merged.values()), multi_label)
+
+async def predict_windowed(texts: List[str], predict_fn: Callable[[List[str]], Awaitable[list]], multi_label: bool) -> list:
+    """Run predict_fn over sliding windows of every text and assemble per-text entities with global offsets."""
+    windows_per_text = [split_into_windows(text) for text in texts]
+    if all(len(windows) == 1 for windows in windows_per_text):
+        return await predict_fn(texts)
+
+    window_texts = [window for windows in windows_per_text for _, window in windows]
+    window_results = await predict_fn(window_texts)
+
+    results = []
+    position = 0
+    for windows in windows_per_text:
+        results.append(merge_window_entities(windows, window_results[position:position + len(windows)], multi_label))
+        position += len(windows)
+    return results
@@ -10,10 +10,79 @@ FINETUNED_MODEL_NAME_FRONTEND = "contrastive-gliner"
 GEMINI_MODEL_NAME_FRONTEND = "gemini-2.5-flash-lite"
 ALLOWED_MODELS = [DEFAULT_MODEL_NAME_FRONTEND, FINETUNED_MODEL_NAME_FRONTEND, GEMINI_MODEL_NAME_FRONTEND]
 
+# Per-model inference backend, e.g. "regular-gliner=onnx,contrastive-gliner=int8"; unlisted models use "torch"
+MODEL_BACKENDS = dict(tuple(part.strip() for part in item.split("=", 1)) for item in os.getenv("MODEL_BACKENDS", "").split(",") if "=" in item)
+ONNX_MODELS_DIR = os.getenv("ONNX_MODELS_DIR", "onnx_models")
+# Combined size of resident model weights before idle models are evicted; 0 disables eviction
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+PRELOAD_MODELS = [name.strip() for name in os.getenv("PRELOAD_MODELS", f"{DEFAULT_MODEL_NAME_FRONTEND},{FINETUNED_MODEL_NAME_FRONTEND}").split(",") if name.strip()]
+
 MAX_TEXT_CHARS = 5_000
 MIN_TEXT_CHARS = 30
 MAX_ENTITY_TYPES = 12
 ALLOWED_LABEL_PATTERN = re.compile(r"^[A-Za-z0-9_\-\s]{1,64}$")
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+EXPERIMENT_BATCH_SIZE = int(os.getenv("EXPERIMENT_BATCH_SIZE", "8"))
+INFERENCE_WORKERS_PER_MODEL = int(os.getenv("INFERENCE_WORKERS_PER_MODEL", "1"))
+INFERENCE_MAX_QUEUE_SIZE = int(os.getenv("INFERENCE_MAX_QUEUE_SIZE", "32"))
+# Background jobs wait for a full inference queue instead of failing, backing off up to this long between checks
+INFERENCE_BUSY_MAX_BACKOFF_SECONDS = float(os.getenv("INFERENCE_BUSY_MAX_BACKOFF_SECONDS", "5"))
+GEMINI_MAX_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_MAX_REQUESTS_PER_MINUTE", "15"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+PREDICTION_CACHE_MONGO = os.getenv("PREDICTION_CACHE_MONGO", "false").lower() == "true"
+SPAN_SCORE_FLOOR = float(os.getenv("SPAN_SCORE_FLOOR", "0.1"))
+SPAN_CACHE_SIZE = int(os.getenv("SPAN_CACHE_SIZE", "512"))
+SPAN_CACHE_TTL_SECONDS = float(os.getenv("SPAN_CACHE_TTL_SECONDS", "3600"))
+# Texts longer than one window are split into overlapping sentence-aligned windows, kept below GLiNER's max sequence length
+CHUNK_WINDOW_CHARS = int(os.getenv("CHUNK_WINDOW_CHARS", "1500"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", "200"))
+
+JOB_STORE = os.getenv("JOB_STORE", "postgres")  # "postgres" or "memory"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_CONCURRENCY_PER_USER = int(os.getenv("JOB_MAX_CONCURRENCY_PER_USER", "1"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+
+FREE_DAILY_LIMIT = int(os.getenv("FREE_DAILY_LIMIT", "5"))
+# Optional write-behind usage metering: counters are kept in process and flushed to Postgres in bulk
+USAGE_METER_ENABLED = os.getenv("USAGE_METER_ENABLED", "false").lower() == "true"
+USAGE_METER_FLUSH_SECONDS = float(os.getenv("USAGE_METER_FLUSH_SECONDS", "10"))
+# Uses per user a process may admit beyond the last stored count, i.e. the bound on over-admission per process
+USAGE_METER_TOLERANCE = int(os.getenv("USAGE_METER_TOLERANCE", "2"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+IMPORT_MAX_UPLOAD_MB = int(os.getenv("IMPORT_MAX_UPLOAD_MB", "200"))
+IMPORT_MAX_DOCUMENT_BYTES = int(os.getenv("IMPORT_MAX_DOCUMENT_BYTES", str(5 * 1024 * 1024)))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+TRAINING_CAPTURE_QUEUE_SIZE = int(os.getenv("TRAINING_CAPTURE_QUEUE_SIZE", "10000"))
+TRAINING_CAPTURE_BATCH_SIZE = int(os.getenv("TRAINING_CAPTURE_BATCH_SIZE", "100"))
+TRAINING_CAPTURE_FLUSH_SECONDS = float(os.getenv("TRAINING_CAPTURE_FLUSH_SECONDS", "1"))
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_MAX_IDLE_SECONDS = int(os.getenv("MONGO_MAX_IDLE_SECONDS", "300"))
+MONGO_SERVER_SELECTION_TIMEOUT_SECONDS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_SECONDS", "5"))
+
+# "zstd" or "none"; payloads smaller than RESULTS_COMPRESSION_MIN_BYTES are stored uncompressed
+RESULTS_COMPRESSION = os.getenv("RESULTS_COMPRESSION", "zstd").lower()
+RESULTS_ZSTD_LEVEL = int(os.getenv("RESULTS_ZSTD_LEVEL", "3"))
+RESULTS_COMPRESSION_MIN_BYTES = int(os.getenv("RESULTS_COMPRESSION_MIN_BYTES", "256"))
+
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "16"))
+ANALYTICS_CACHE_TTL_SECONDS = int(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "3600"))
+ANALYTICS_SCORE_BINS = 10
+ANALYTICS_MAX_COMPARE_RUNS = 5
+
 ALLOWED_FRONTEND_URLS = ["http://localhost:80", "http://localhost:8080", "http://gliner-medical.switzerlandnorth.cloudapp.azure.com"]
 
 EXPERIMENT_IMAGE_URLS = [
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import Column, Integer, String, Date, Index, func
-from sqlalchemy.orm import declarative_base, sessionmaker
-import os
+from sqlalchemy import Column, Integer, String, Date, Index, delete, func, inspect, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from typing import Dict, Optional, Tuple
 from datetime import date, datetime, timedelta
 from utils import get_user_from_token
-from experiments import SessionLocal, Base
+from database import Base, engine, AsyncSessionLocal
+import constants
 
 DAILY_USAGE_TABLE_NAME = "daily_usage"
 
@@ -17,67 +18,119 @@ class DailyUsage(Base):
     usage_count = Column(Integer, default=0, nullable=False)
     
     __table_args__ = (
-        Index('idx_user_date', 'user_id', 'usage_date'),
+        Index('uq_daily_usage_user_date', 'user_id', 'usage_date', unique=True),
         {"schema": "experiments"}
     )
 
-Base.metadata.create_all(bind=SessionLocal.kw['bind'])
+Base.metadata.create_all(bind=engine)
+
+def ensure_unique_usage_index():
+    """Upgrade tables created with the old non-unique index. Duplicate rows for a user and day are merged
+    into the latest one, which keeps their summed usage count.
+
+    A one-off migration: once the unique index exists it returns without locking the table."""
+    indexes = inspect(engine).get_indexes(DAILY_USAGE_TABLE_NAME, schema="experiments")
+    if any(index["name"] == "uq_daily_usage_user_date" for index in indexes):
+        return
+    with engine.begin() as connection:
+        # Keeps other replicas from counting uses into rows that are about to be merged
+        connection.execute(text(f"LOCK TABLE experiments.{DAILY_USAGE_TABLE_NAME} IN SHARE ROW EXCLUSIVE MODE"))
+        connection.execute(text(f"""
+            UPDATE experiments.{DAILY_USAGE_TABLE_NAME} u
+            SET usage_count = d.total
+            FROM (
+                SELECT MAX(id) AS id, SUM(usage_count) AS total
+                FROM experiments.{DAILY_USAGE_TABLE_NAME}
+                GROUP BY user_id, usage_date
+                HAVING COUNT(*) > 1
+            ) d
+            WHERE u.id = d.id
+        """))
+        connection.execute(text(f"""
+            DELETE FROM experiments.{DAILY_USAGE_TABLE_NAME} a
+            USING experiments.{DAILY_USAGE_TABLE_NAME} b
+            WHERE a.user_id = b.user_id AND a.usage_date = b.usage_date AND a.id < b.id
+        """))
+        connection.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_usage_user_date ON experiments.{DAILY_USAGE_TABLE_NAME} (user_id, usage_date)"))
+        connection.execute(text("DROP INDEX IF EXISTS experiments.idx_user_date"))
+
+ensure_unique_usage_index()
 
 router = APIRouter()
 
-def get_user_usage_today(user_id: str) -> int:
-    """Get today's usage count for a user"""
-    session = SessionLocal()
-    try:
-        today = date.today()
-        usage_record = session.query(DailyUsage).filter(
+async def get_user_usage(user_id: str, usage_date: date) -> int:
+    """Get a user's usage count for a day"""
+    async with AsyncSessionLocal() as session:
+        usage_count = await session.scalar(select(DailyUsage.usage_count).where(
             DailyUsage.user_id == user_id,
-            DailyUsage.usage_date == today
-        ).first()
-        
-        return usage_record.usage_count if usage_record else 0
-    finally:
-        session.close()
+            DailyUsage.usage_date == usage_date
+        ))
+        return usage_count or 0
 
-def increment_user_usage(user_id: str) -> int:
-    """Increment today's usage count for a user and return new count"""
-    session = SessionLocal()
-    try:
-        today = date.today()
-        usage_record = session.query(DailyUsage).filter(
-            DailyUsage.user_id == user_id,
-            DailyUsage.usage_date == today
-        ).first()
-        
-        if usage_record:
-            usage_record.usage_count += 1
-            new_count = usage_record.usage_count
-        else:
-            new_record = DailyUsage(
-                user_id=user_id,
-                usage_date=today,
-                usage_count=1
-            )
-            session.add(new_record)
-            new_count = 1
-        
-        session.commit()
+async def get_user_usage_today(user_id: str) -> int:
+    """Get today's usage count for a user"""
+    return await get_user_usage(user_id, date.today())
+
+async def reserve_user_usage(user_id: str, daily_limit: int, usage_date: date) -> Optional[int]:
+    """Atomically count one use against the daily limit in a single statement.
+
+    Returns the new count, or None when the limit is already reached.
+    """
+    statement = insert(DailyUsage).values(
+        user_id=user_id,
+        usage_date=usage_date,
+        usage_count=1
+    ).on_conflict_do_update(
+        index_elements=[DailyUsage.user_id, DailyUsage.usage_date],
+        set_={"usage_count": DailyUsage.usage_count + 1},
+        where=DailyUsage.usage_count < daily_limit
+    ).returning(DailyUsage.usage_count)
+
+    async with AsyncSessionLocal() as session:
+        new_count = (await session.execute(statement)).scalar()
+        await session.commit()
         return new_count
-    finally:
-        session.close()
 
-def cleanup_old_usage_records():
+async def refund_user_usage(user_id: str, usage_date: date):
+    """Give back a reserved use, e.g. when the request it was reserved for failed."""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(DailyUsage).where(
+                DailyUsage.user_id == user_id,
+                DailyUsage.usage_date == usage_date,
+                DailyUsage.usage_count > 0
+            ).values(usage_count=DailyUsage.usage_count - 1)
+        )
+        await session.commit()
+
+async def add_usage_deltas(deltas: Dict[Tuple[str, date], int]) -> Dict[Tuple[str, date], int]:
+    """Apply usage count changes for many (user_id, usage_date) pairs in one statement, returning the new counts."""
+    if not deltas:
+        return {}
+    # A net negative delta (more refunds than uses since the last flush) only occurs for a row that already exists
+    statement = insert(DailyUsage).values([
+        {"user_id": user_id, "usage_date": usage_date, "usage_count": delta}
+        for (user_id, usage_date), delta in deltas.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[DailyUsage.user_id, DailyUsage.usage_date],
+        set_={"usage_count": func.greatest(DailyUsage.usage_count + statement.excluded.usage_count, 0)}
+    ).returning(DailyUsage.user_id, DailyUsage.usage_date, DailyUsage.usage_count)
+
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(statement)).all()
+        await session.commit()
+        return {(row.user_id, row.usage_date): row.usage_count for row in rows}
+
+async def cleanup_old_usage_records():
     """Delete usage records from the previous day"""
-    session = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as session:
         yesterday = date.today() - timedelta(days=1)
-        deleted_count = session.query(DailyUsage).filter(
+        result = await session.execute(delete(DailyUsage).where(
             DailyUsage.usage_date <= yesterday
-        ).delete()
-        session.commit()
-        return deleted_count
-    finally:
-        session.close()
+        ))
+        await session.commit()
+        return result.rowcount
 
 @router.get("/usage-status")
 async def get_usage_status(request: Request):
@@ -95,8 +148,9 @@ async def get_usage_status(request: Request):
                 "remaining": None
             }
         
-        used_today = get_user_usage_today(user_id)
-        daily_limit = 5
+        from usage_meter import get_usage
+        used_today = await get_usage(user_id, date.today())
+        daily_limit = constants.FREE_DAILY_LIMIT
         remaining = max(0, daily_limit - used_today)
         
         return {
@@ -114,7 +168,7 @@ async def get_usage_status(request: Request):
 async def cleanup_usage_records():
     """Cleanup usage records from previous day (for admin/scheduled tasks)"""
     try:
-        deleted_count = cleanup_old_usage_records()
+        deleted_count = await cleanup_old_usage_records()
         return {
             "message": f"Cleaned up {deleted_count} usage records from previous day",
             "deleted_count": deleted_count
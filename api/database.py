@@ -0,0 +1,48 @@
+import os
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+import constants
+
+DATABASE_URL = os.getenv("POSTGRES_URL")
+
+def to_async_url(url: str) -> str:
+    """The same database URL using the asyncpg driver."""
+    scheme, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}" if scheme.split("+")[0] in ("postgres", "postgresql") else url
+
+Base = declarative_base()
+
+# Synchronous engine, only used for creating tables and indexes at startup
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=1, max_overflow=0)
+
+async_engine = create_async_engine(
+    to_async_url(DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=constants.DB_POOL_SIZE,
+    max_overflow=constants.DB_MAX_OVERFLOW,
+    pool_timeout=constants.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=constants.DB_POOL_RECYCLE_SECONDS,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+async def get_session():
+    """FastAPI dependency providing one session per request, closed (and rolled back if uncommitted) afterwards."""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+def ensure_indexes(table):
+    """Create the table's declared indexes that are missing, since create_all skips tables that already exist."""
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+def ensure_columns(table):
+    """Add the table's declared columns that are missing, since create_all skips tables that already exist.
+    Added columns are nullable, so existing rows need no default."""
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name, schema=table.schema)}
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                connection.execute(text(
+                    f'ALTER TABLE {table.schema}.{table.name} ADD COLUMN IF NOT EXISTS {column.name} {column.type.compile(engine.dialect)}'
+                ))
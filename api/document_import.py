@@ -0,0 +1,232 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import zipfile
+import constants
+from constants import DOCUMENT_IMAGE_URLS
+from database import get_session
+from documents import Document
+from experiments import Experiment
+from utils import premium_user_required
+
+IMPORT_FORMATS = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "text/csv": "csv",
+    "application/zip": "zip",
+    "application/x-zip-compressed": "zip",
+}
+# Uploads are buffered in memory up to this size, then spill to a temporary file
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+
+# A field is never read past the per-document limit; the csv.Error raised for it rejects only its row
+csv.field_size_limit(constants.IMPORT_MAX_DOCUMENT_BYTES)
+
+router = APIRouter()
+
+# Each parser yields (row reference, document fields or None, error or None)
+ParsedRow = Tuple[str, Optional[dict], Optional[str]]
+
+def validate_fields(fields: dict) -> Tuple[Optional[dict], Optional[str]]:
+    title = fields.get("title")
+    text = fields.get("text")
+    if not isinstance(title, str) or not title.strip() or not isinstance(text, str) or not text.strip():
+        return None, "Title and text required"
+    image_url = fields.get("image_url")
+    if image_url is not None and not isinstance(image_url, str):
+        return None, "image_url must be a string"
+    return {"title": title, "text": text, "image_url": image_url or None}, None
+
+def document_size(fields: dict) -> int:
+    return sum(len(value.encode("utf-8")) for value in fields.values() if isinstance(value, str))
+
+def parse_jsonl(upload) -> Iterator[ParsedRow]:
+    for line_number in itertools.count(1):
+        # Read at most one byte past the limit, so a single huge line cannot exhaust memory
+        line = upload.readline(constants.IMPORT_MAX_DOCUMENT_BYTES + 1)
+        if not line:
+            return
+        if len(line) > constants.IMPORT_MAX_DOCUMENT_BYTES and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = upload.readline(constants.IMPORT_MAX_DOCUMENT_BYTES + 1)
+            yield f"line {line_number}", None, "Document too large"
+            continue
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            yield f"line {line_number}", None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(fields, dict):
+            yield f"line {line_number}", None, "Expected a JSON object"
+            continue
+        yield (f"line {line_number}", *validate_fields(fields))
+
+class CsvLines:
+    """Physical lines of a CSV upload for csv.reader, each read with a bounded readline, so a single huge
+    line cannot exhaust memory. Counts the quote characters of the current record, so that after a
+    record is rejected the rest of it, including lines inside a quoted field, can be skipped."""
+
+    def __init__(self, stream, limit: int):
+        self.stream = stream
+        self.limit = limit
+        self.quotes = 0
+        self.at_line_end = True
+
+    def __iter__(self):
+        return self
+
+    def _readline(self) -> str:
+        line = self.stream.readline(self.limit + 1)
+        self.quotes += line.count('"')
+        self.at_line_end = not line or line.endswith(("\n", "\r"))
+        return line
+
+    def __next__(self) -> str:
+        line = self._readline()
+        if not line:
+            raise StopIteration
+        if not self.at_line_end and len(line) > self.limit:
+            raise csv.Error(f"line longer than {self.limit} characters")
+        return line
+
+    def end_record(self):
+        self.quotes = 0
+
+    def skip_record(self):
+        while not self.at_line_end or self.quotes % 2:
+            if not self._readline():
+                break
+        self.end_record()
+
+def parse_csv(upload) -> Iterator[ParsedRow]:
+    lines = CsvLines(io.TextIOWrapper(upload, encoding="utf-8-sig", errors="strict", newline=""), constants.IMPORT_MAX_DOCUMENT_BYTES)
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or not {"title", "text"} <= set(reader.fieldnames):
+        raise HTTPException(status_code=400, detail="CSV header must include title and text columns")
+    lines.end_record()
+    for record_number in itertools.count(1):
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            lines.skip_record()
+            yield f"row {record_number}", None, f"Invalid row: {e}"
+            continue
+        lines.end_record()
+        if document_size(record) > constants.IMPORT_MAX_DOCUMENT_BYTES:
+            yield f"row {record_number}", None, "Document too large"
+            continue
+        yield (f"row {record_number}", *validate_fields(record))
+
+def parse_zip(upload) -> Iterator[ParsedRow]:
+    try:
+        archive = zipfile.ZipFile(upload)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    with archive:
+        for member in archive.infolist():
+            if member.is_dir() or os.path.basename(member.filename).startswith("."):
+                continue
+            try:
+                # Read at most one byte past the limit, so a member lying about its size cannot exhaust memory
+                with archive.open(member) as f:
+                    content = f.read(constants.IMPORT_MAX_DOCUMENT_BYTES + 1)
+                if len(content) > constants.IMPORT_MAX_DOCUMENT_BYTES:
+                    yield member.filename, None, "File too large"
+                    continue
+                text = content.decode("utf-8")
+            except (UnicodeDecodeError, zipfile.BadZipFile, RuntimeError) as e:
+                yield member.filename, None, f"Unreadable file: {e}"
+                continue
+            title = os.path.splitext(os.path.basename(member.filename))[0]
+            yield (member.filename, *validate_fields({"title": title, "text": text}))
+
+PARSERS = {"jsonl": parse_jsonl, "csv": parse_csv, "zip": parse_zip}
+
+def next_rows(rows: Iterator[ParsedRow], count: int) -> List[ParsedRow]:
+    return list(itertools.islice(rows, count))
+
+async def spool_upload(request: Request):
+    """Copy the streamed request body to a spooled temporary file, enforcing the upload size limit."""
+    upload = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > constants.IMPORT_MAX_UPLOAD_MB * 1024 * 1024:
+            upload.close()
+            raise HTTPException(status_code=413, detail=f"Upload larger than {constants.IMPORT_MAX_UPLOAD_MB} MB")
+        upload.write(chunk)
+    upload.seek(0)
+    return upload
+
+@router.post("/experiments/{experiment_id}/documents/import")
+async def import_documents(experiment_id: int, request: Request, format: Optional[str] = None,
+                           user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """Import many documents from a JSONL, CSV (title, text and optional image_url fields) or zip of
+    text files upload, sent as the raw request body. Valid rows are inserted in batches; invalid
+    rows are skipped and reported."""
+    import_format = format or IMPORT_FORMATS.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if import_format not in PARSERS:
+        raise HTTPException(status_code=400, detail="Unsupported format, use JSONL, CSV or zip")
+
+    experiment = await session.scalar(select(Experiment.id).where(Experiment.id == experiment_id, Experiment.user_id == user["id"]))
+    if not experiment:
+        raise HTTPException(status_code=404, detail="Experiment not found or not owned by user")
+    await session.commit()
+
+    upload = await spool_upload(request)
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    async def insert_batch():
+        nonlocal imported
+        await session.execute(insert(Document), batch)
+        await session.commit()
+        imported += len(batch)
+        batch.clear()
+
+    try:
+        rows = PARSERS[import_format](upload)
+        # Reading, decompressing and parsing run in a worker thread, a batch of rows at a time,
+        # so a large upload does not block the event loop
+        while parsed := await asyncio.to_thread(next_rows, rows, constants.IMPORT_BATCH_SIZE):
+            for row, fields, error in parsed:
+                if error:
+                    failed += 1
+                    if len(errors) < constants.IMPORT_MAX_REPORTED_ERRORS:
+                        errors.append({"row": row, "error": error})
+                    continue
+                fields["image_url"] = fields["image_url"] or random.choice(DOCUMENT_IMAGE_URLS)
+                batch.append({**fields, "date_added": datetime.utcnow(), "experiment_id": experiment_id})
+                if len(batch) >= constants.IMPORT_BATCH_SIZE:
+                    await insert_batch()
+        if batch:
+            await insert_batch()
+    except UnicodeDecodeError as e:
+        errors.append({"row": None, "error": f"Upload is not valid UTF-8: {e}"})
+    except csv.Error as e:
+        errors.append({"row": None, "error": f"Invalid CSV: {e}"})
+    finally:
+        upload.close()
+
+    return {
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > constants.IMPORT_MAX_REPORTED_ERRORS
+    }
@@ -1,17 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, Boolean, Float
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-import os
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, Index, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
 import random
 from constants import DOCUMENT_IMAGE_URLS
 from utils import premium_user_required
-from experiments import SessionLocal, Base, Experiment
+from database import Base, engine, ensure_indexes, get_session
+from experiments import Experiment
+from pagination import check_limit, decode_cursor, next_cursor
 
 DOCUMENTS_TABLE_NAME = "documents"
+DOCUMENT_PREVIEW_CHARS = 200
 
 class Document(Base):
     __tablename__ = DOCUMENTS_TABLE_NAME
-    __table_args__ = {"schema": "experiments"}
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     text = Column(Text, nullable=False)
@@ -19,31 +22,57 @@ class Document(Base):
     image_url = Column(String, nullable=True)
     experiment_id = Column(Integer, ForeignKey("experiments.experiments.id", ondelete="CASCADE"), nullable=False)
 
-Base.metadata.create_all(bind=SessionLocal.kw['bind'])
+    __table_args__ = (
+        Index("ix_documents_experiment_date_added", "experiment_id", "date_added", "id"),
+        {"schema": "experiments"}
+    )
+
+Base.metadata.create_all(bind=engine)
+ensure_indexes(Document.__table__)
 
 router = APIRouter()
 
 @router.get("/experiments/{experiment_id}/documents")
-async def list_documents(experiment_id: int, request: Request, user=Depends(premium_user_required)):
-    session = SessionLocal()
-    experiment = session.query(Experiment).filter(Experiment.id == experiment_id).first()
+async def list_documents(experiment_id: int, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                         user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """List an experiment's documents. With limit, returns one page ordered by date added, with a
+    text preview instead of the full text and a next_cursor to pass back for the following page."""
+    experiment = await session.get(Experiment, experiment_id)
     if not experiment:
-        session.close()
         raise HTTPException(status_code=404, detail="Experiment not found")
-    docs = session.query(Document).filter(Document.experiment_id == experiment_id).all()
-    documents = [{"id": d.id, "title": d.title, "text": d.text, "date_added": d.date_added, "image_url": d.image_url} for d in docs]
-    session.close()
+    experiment_data = {
+        "id": experiment.id,
+        "name": experiment.name,
+        "image_url": experiment.image_url
+    }
+
+    if limit is None:
+        docs = (await session.scalars(select(Document).where(Document.experiment_id == experiment_id))).all()
+        documents = [{"id": d.id, "title": d.title, "text": d.text, "date_added": d.date_added, "image_url": d.image_url} for d in docs]
+        return {"experiment": experiment_data, "documents": documents}
+
+    limit = check_limit(limit)
+    query = select(
+        Document.id,
+        Document.title,
+        func.left(Document.text, DOCUMENT_PREVIEW_CHARS).label("preview"),
+        func.length(Document.text).label("text_length"),
+        Document.date_added,
+        Document.image_url
+    ).where(Document.experiment_id == experiment_id)
+    after = decode_cursor(cursor, datetime, int)
+    if after:
+        query = query.where(tuple_(Document.date_added, Document.id) > tuple(after))
+    rows = (await session.execute(query.order_by(Document.date_added, Document.id).limit(limit + 1))).all()
+
     return {
-        "experiment": {
-            "id": experiment.id,
-            "name": experiment.name,
-            "image_url": experiment.image_url
-        },
-        "documents": documents
+        "experiment": experiment_data,
+        "documents": [dict(row._mapping) for row in rows[:limit]],
+        "next_cursor": next_cursor(rows, limit, lambda row: (row.date_added, row.id))
     }
 
 @router.post("/experiments/{experiment_id}/documents")
-async def add_document(experiment_id: int, data: dict, request: Request, user=Depends(premium_user_required)):
+async def add_document(experiment_id: int, data: dict, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
     title = data.get("title")
     text = data.get("text")
     if not title or not text:
@@ -53,23 +82,18 @@ async def add_document(experiment_id: int, data: dict, request: Request, user=De
     image_url = custom_image_url if custom_image_url else random.choice(DOCUMENT_IMAGE_URLS)
     
     from datetime import datetime
-    session = SessionLocal()
     doc = Document(title=title, text=text, date_added=datetime.utcnow(), image_url=image_url, experiment_id=experiment_id)
     session.add(doc)
-    session.commit()
-    session.refresh(doc)
-    session.close()
+    await session.commit()
     return {"id": doc.id, "title": doc.title, "text": doc.text, "date_added": doc.date_added, "image_url": doc.image_url}
 
 
 @router.get("/documents/{document_id}")
-async def get_document(document_id: int, request: Request, user=Depends(premium_user_required)):
-    session = SessionLocal()
-    doc = session.query(Document).filter(Document.id == document_id).first()
+async def get_document(document_id: int, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    doc = await session.get(Document, document_id)
     if not doc:
-        session.close()
         raise HTTPException(status_code=404, detail="Document not found")
-    document_data = {
+    return {
         "id": doc.id,
         "title": doc.title,
         "text": doc.text,
@@ -77,17 +101,12 @@ async def get_document(document_id: int, request: Request, user=Depends(premium_
         "image_url": doc.image_url,
         "experiment_id": doc.experiment_id
     }
-    session.close()
-    return document_data
 
 @router.delete("/documents/{document_id}")
-async def delete_document(document_id: int, request: Request, user=Depends(premium_user_required)):
-    session = SessionLocal()
-    doc = session.query(Document).filter(Document.id == document_id).first()
+async def delete_document(document_id: int, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    doc = await session.get(Document, document_id)
     if not doc:
-        session.close()
         raise HTTPException(status_code=404, detail="Document not found")
-    session.delete(doc)
-    session.commit()
-    session.close()
+    await session.delete(doc)
+    await session.commit()
     return {"success": True, "message": "Document deleted"}
@@ -0,0 +1,362 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import Column, Integer, String, Text, Boolean, TIMESTAMP, ForeignKey, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Base, engine, ensure_columns, AsyncSessionLocal, get_session
+from experiment_runs import ExperimentRun, prepare_run, run_document_batches, find_previous_predictions
+from utils import premium_user_required
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import asyncio
+import uuid
+import constants
+
+EXPERIMENT_RUN_JOBS_TABLE_NAME = "experiment_run_jobs"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+class ExperimentRunJob(Base):
+    __tablename__ = EXPERIMENT_RUN_JOBS_TABLE_NAME
+    __table_args__ = {"schema": "experiments"}
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("experiments.experiment_runs.id", ondelete="CASCADE"), nullable=False, unique=True)
+    experiment_id = Column(Integer, nullable=False)
+    user_id = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, index=True)  # queued, running, completed, failed
+    incremental = Column(Boolean, nullable=False, default=False)
+    total_documents = Column(Integer, nullable=False)
+    processed_documents = Column(Integer, nullable=False, default=0)
+    last_document_id = Column(Integer, nullable=False, default=0)  # checkpoint: every document up to this id is stored
+    error = Column(Text, nullable=True)
+    claim_token = Column(String, nullable=True)  # set on every claim; updates from a worker that lost the job match nothing
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+
+Base.metadata.create_all(bind=engine)
+ensure_columns(ExperimentRunJob.__table__)
+
+router = APIRouter()
+
+def job_to_dict(job) -> dict:
+    return {
+        "id": job.id,
+        "run_id": job.run_id,
+        "experiment_id": job.experiment_id,
+        "user_id": job.user_id,
+        "status": job.status,
+        "incremental": job.incremental,
+        "total_documents": job.total_documents,
+        "processed_documents": job.processed_documents,
+        "last_document_id": job.last_document_id,
+        "error": job.error,
+        "claim_token": job.claim_token,
+    }
+
+class PostgresJobStore:
+    """Jobs persisted in Postgres. A running job whose heartbeat is older than JOB_STALE_SECONDS
+    (e.g. its worker was restarted) is claimed again and resumes from its checkpoint.
+
+    Each claim gets a new claim token, and heartbeats, checkpoints and finishing only apply while the token
+    still matches, so a worker whose job was reclaimed cannot overwrite the new owner's progress."""
+
+    async def create(self, run_id: int, experiment_id: int, user_id: str, total_documents: int, incremental: bool = False) -> dict:
+        job = ExperimentRunJob(
+            run_id=run_id,
+            experiment_id=experiment_id,
+            user_id=user_id,
+            status=JOB_QUEUED,
+            incremental=incremental,
+            total_documents=total_documents,
+            processed_documents=0,
+            last_document_id=0,
+        )
+        async with AsyncSessionLocal() as session:
+            session.add(job)
+            await session.commit()
+        return job_to_dict(job)
+
+    async def claim(self, per_user_limit: int) -> Optional[dict]:
+        stale_before = datetime.utcnow() - timedelta(seconds=constants.JOB_STALE_SECONDS)
+        Running = ExperimentRunJob.__table__.alias("running")
+        running_for_user = select(func.count(Running.c.id)).where(
+            Running.c.user_id == ExperimentRunJob.user_id,
+            Running.c.status == JOB_RUNNING,
+            Running.c.updated_at >= stale_before
+        ).scalar_subquery()
+
+        # Users whose candidate job turned out to be over the limit once their claims were serialized
+        skipped_users = []
+        while True:
+            async with AsyncSessionLocal() as session:
+                job = await session.scalar(select(ExperimentRunJob).where(
+                    or_(
+                        ExperimentRunJob.status == JOB_QUEUED,
+                        (ExperimentRunJob.status == JOB_RUNNING) & (ExperimentRunJob.updated_at < stale_before)
+                    ),
+                    running_for_user < per_user_limit,
+                    ExperimentRunJob.user_id.notin_(skipped_users)
+                ).order_by(ExperimentRunJob.id).limit(1).with_for_update(skip_locked=True))
+                if not job:
+                    return None
+
+                # The row lock only covers this job, so claims for the same user are serialized with a
+                # transaction-scoped advisory lock and the running count is checked again under it
+                await session.execute(select(func.pg_advisory_xact_lock(func.hashtext(job.user_id))))
+                running = await session.scalar(select(func.count(ExperimentRunJob.id)).where(
+                    ExperimentRunJob.user_id == job.user_id,
+                    ExperimentRunJob.status == JOB_RUNNING,
+                    ExperimentRunJob.updated_at >= stale_before,
+                    ExperimentRunJob.id != job.id
+                ))
+                if running >= per_user_limit:
+                    skipped_users.append(job.user_id)
+                    await session.rollback()
+                    continue
+
+                job.status = JOB_RUNNING
+                job.claim_token = uuid.uuid4().hex
+                job.updated_at = datetime.utcnow()
+                await session.commit()
+                return job_to_dict(job)
+
+    async def _update(self, job_id: int, claim_token: str, values: dict) -> bool:
+        """Update a running job the caller still owns, returning False when it no longer does."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(update(ExperimentRunJob).where(
+                ExperimentRunJob.id == job_id,
+                ExperimentRunJob.claim_token == claim_token,
+                ExperimentRunJob.status == JOB_RUNNING
+            ).values(**values, updated_at=datetime.utcnow()))
+            await session.commit()
+            return result.rowcount == 1
+
+    async def heartbeat(self, job_id: int, claim_token: str) -> bool:
+        return await self._update(job_id, claim_token, {})
+
+    async def checkpoint(self, job_id: int, claim_token: str, processed_documents: int, last_document_id: int) -> bool:
+        return await self._update(job_id, claim_token, {"processed_documents": processed_documents, "last_document_id": last_document_id})
+
+    async def finish(self, job_id: int, claim_token: str, status: str, error: Optional[str] = None) -> bool:
+        return await self._update(job_id, claim_token, {"status": status, "error": error})
+
+    async def get_by_run(self, run_id: int) -> Optional[dict]:
+        async with AsyncSessionLocal() as session:
+            job = await session.scalar(select(ExperimentRunJob).where(ExperimentRunJob.run_id == run_id))
+            return job_to_dict(job) if job else None
+
+class InMemoryJobStore:
+    """Jobs kept in process memory, for tests and local development. Nothing survives a restart.
+    As in Postgres, a running job without a heartbeat for JOB_STALE_SECONDS is claimed again."""
+
+    def __init__(self):
+        self.jobs: Dict[int, dict] = {}
+        self.next_id = 1
+
+    async def create(self, run_id: int, experiment_id: int, user_id: str, total_documents: int, incremental: bool = False) -> dict:
+        job = {
+            "id": self.next_id,
+            "run_id": run_id,
+            "experiment_id": experiment_id,
+            "user_id": user_id,
+            "status": JOB_QUEUED,
+            "incremental": incremental,
+            "total_documents": total_documents,
+            "processed_documents": 0,
+            "last_document_id": 0,
+            "error": None,
+            "claim_token": None,
+            "updated_at": datetime.utcnow(),
+        }
+        self.jobs[job["id"]] = job
+        self.next_id += 1
+        return dict(job)
+
+    async def claim(self, per_user_limit: int) -> Optional[dict]:
+        stale_before = datetime.utcnow() - timedelta(seconds=constants.JOB_STALE_SECONDS)
+        running = {}
+        for job in self.jobs.values():
+            if job["status"] == JOB_RUNNING and job["updated_at"] >= stale_before:
+                running[job["user_id"]] = running.get(job["user_id"], 0) + 1
+        for job in self.jobs.values():
+            claimable = job["status"] == JOB_QUEUED or (job["status"] == JOB_RUNNING and job["updated_at"] < stale_before)
+            if claimable and running.get(job["user_id"], 0) < per_user_limit:
+                job.update(status=JOB_RUNNING, claim_token=uuid.uuid4().hex, updated_at=datetime.utcnow())
+                return dict(job)
+        return None
+
+    def _owned(self, job_id: int, claim_token: str) -> bool:
+        job = self.jobs[job_id]
+        return job["status"] == JOB_RUNNING and job["claim_token"] == claim_token
+
+    def _update(self, job_id: int, claim_token: str, **values) -> bool:
+        if not self._owned(job_id, claim_token):
+            return False
+        self.jobs[job_id].update(values, updated_at=datetime.utcnow())
+        return True
+
+    async def heartbeat(self, job_id: int, claim_token: str) -> bool:
+        return self._update(job_id, claim_token)
+
+    async def checkpoint(self, job_id: int, claim_token: str, processed_documents: int, last_document_id: int) -> bool:
+        return self._update(job_id, claim_token, processed_documents=processed_documents, last_document_id=last_document_id)
+
+    async def finish(self, job_id: int, claim_token: str, status: str, error: Optional[str] = None) -> bool:
+        return self._update(job_id, claim_token, status=status, error=error)
+
+    async def get_by_run(self, run_id: int) -> Optional[dict]:
+        for job in self.jobs.values():
+            if job["run_id"] == run_id:
+                return dict(job)
+        return None
+
+async def get_run_details(run_id: int) -> dict:
+    async with AsyncSessionLocal() as session:
+        run = await session.get(ExperimentRun, run_id)
+    return {
+        "id": run.id,
+        "model": run.model,
+        "threshold": run.threshold,
+        "labels_to_extract": run.labels_to_extract,
+        "allow_multilabeling": run.allow_multilabeling
+    }
+
+class ExperimentJobWorkers:
+    """A fixed pool of asyncio workers processing experiment run jobs from a job store."""
+
+    def __init__(self, store, num_workers: int = constants.JOB_WORKERS, per_user_limit: int = constants.JOB_MAX_CONCURRENCY_PER_USER):
+        self.store = store
+        self.num_workers = num_workers
+        self.per_user_limit = per_user_limit
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self.store.claim(self.per_user_limit)
+            except Exception as e:
+                print(f"Error claiming experiment job: {e}")
+                job = None
+
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=constants.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.process(job)
+            except Exception as e:
+                # e.g. the database failing while the job is finished; the job stays running
+                # and is claimed again once its heartbeat is stale
+                print(f"Error processing experiment job {job['id']}: {e}")
+
+    async def _heartbeat(self, job: dict, run_task: asyncio.Task, lost: asyncio.Event):
+        """Refresh the job's heartbeat while it runs, so a slow batch is not mistaken for a dead worker.
+        Stops the run if another worker has taken the job over."""
+        while True:
+            await asyncio.sleep(constants.JOB_STALE_SECONDS / 3)
+            try:
+                owned = await self.store.heartbeat(job["id"], job["claim_token"])
+            except Exception as e:
+                print(f"Heartbeat for experiment job {job['id']} failed: {e}")
+                continue
+            if not owned:
+                lost.set()
+                run_task.cancel()
+                return
+
+    async def process(self, job: dict):
+        lost = asyncio.Event()
+        run_task = asyncio.create_task(self._run(job))
+        heartbeat_task = asyncio.create_task(self._heartbeat(job, run_task, lost))
+        try:
+            await run_task
+        except asyncio.CancelledError:
+            if not lost.is_set():
+                raise
+            print(f"Experiment job {job['id']} was claimed by another worker, stopping")
+        finally:
+            heartbeat_task.cancel()
+
+    async def _run(self, job: dict):
+        from inference_executor import wait_when_busy
+        from result_store import delete_results_after, migrate_legacy_results
+        # Only affects this job's task: a full inference queue slows the job down instead of failing it
+        wait_when_busy.set(True)
+        try:
+            run = await get_run_details(job["run_id"])
+            # Drop results stored after the last checkpoint, since that batch is predicted again on resume
+            await migrate_legacy_results([run["id"]])
+            await delete_results_after(run["id"], job["last_document_id"])
+
+            previous = await find_previous_predictions(job["experiment_id"], run, exclude_run_id=run["id"]) if job["incremental"] else None
+            processed = job["processed_documents"]
+            async for last_document_id, results in run_document_batches(job["experiment_id"], run, after_id=job["last_document_id"], previous=previous):
+                processed += len(results)
+                if not await self.store.checkpoint(job["id"], job["claim_token"], processed, last_document_id):
+                    print(f"Experiment job {job['id']} was claimed by another worker, stopping")
+                    return
+
+            await self.store.finish(job["id"], job["claim_token"], JOB_COMPLETED)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"Experiment job {job['id']} failed: {detail}")
+            await self.store.finish(job["id"], job["claim_token"], JOB_FAILED, detail)
+
+job_workers = None
+
+def get_job_workers() -> ExperimentJobWorkers:
+    global job_workers
+    if job_workers is None:
+        store = InMemoryJobStore() if constants.JOB_STORE == "memory" else PostgresJobStore()
+        job_workers = ExperimentJobWorkers(store)
+    return job_workers
+
+@router.post("/experiments/{experiment_id}/runs/jobs")
+async def enqueue_experiment_run(experiment_id: int, data: dict, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """Start an experiment run in the background and return its id immediately."""
+    from documents import Document
+    run_info = await prepare_run(experiment_id, data)
+    total_documents = await session.scalar(select(func.count(Document.id)).where(Document.experiment_id == experiment_id))
+
+    workers = get_job_workers()
+    job = await workers.store.create(run_info["id"], experiment_id, user["id"], total_documents, bool(data.get("incremental")))
+    workers.notify()
+
+    return {**run_info, "status": job["status"], "progress": 0.0}
+
+@router.get("/experiment-runs/{run_id}/status")
+async def get_experiment_run_status(run_id: int, request: Request, user=Depends(premium_user_required)):
+    job = await get_job_workers().store.get_by_run(run_id)
+    if not job or job["user_id"] != user["id"]:
+        raise HTTPException(status_code=404, detail="Experiment run job not found")
+
+    total = job["total_documents"]
+    progress = 100.0 if job["status"] == JOB_COMPLETED else min(100.0, 100.0 * job["processed_documents"] / total) if total else 0.0
+    return {
+        "run_id": run_id,
+        "status": job["status"],
+        "progress": round(progress, 1),
+        "processed_documents": job["processed_documents"],
+        "total_documents": total,
+        "error": job["error"],
+    }
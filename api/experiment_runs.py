@@ -1,15 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import Column, Integer, String, Text, Boolean, Float, TIMESTAMP, ForeignKey
-from sqlalchemy.orm import declarative_base
-from experiments import SessionLocal, Base
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Column, Integer, String, Text, Boolean, Float, TIMESTAMP, ForeignKey, Index, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Base, engine, ensure_indexes, AsyncSessionLocal, get_session
+from pagination import check_limit, decode_cursor, next_cursor
 from utils import premium_user_required
 from datetime import datetime
+from typing import Optional
+import json
+import constants
 
 EXPERIMENT_RUNS_TABLE_NAME = "experiment_runs"
 
 class ExperimentRun(Base):
     __tablename__ = EXPERIMENT_RUNS_TABLE_NAME
-    __table_args__ = {"schema": "experiments"}
     id = Column(Integer, primary_key=True, index=True)
     model = Column(String, nullable=False)
     labels_to_extract = Column(Text, nullable=False)
@@ -18,27 +22,107 @@ class ExperimentRun(Base):
     experiment_id = Column(Integer, ForeignKey("experiments.experiments.id", ondelete="CASCADE"), nullable=False)
     date_ran = Column(TIMESTAMP, nullable=False)
 
-Base.metadata.create_all(bind=SessionLocal.kw['bind'])
+    __table_args__ = (
+        Index("ix_experiment_runs_experiment_date_ran", "experiment_id", "date_ran", "id"),
+        {"schema": "experiments"}
+    )
+
+Base.metadata.create_all(bind=engine)
+ensure_indexes(ExperimentRun.__table__)
 
 router = APIRouter()
 
 @router.get("/experiments/{experiment_id}/runs")
-async def list_experiment_runs(experiment_id: int, request: Request, user=Depends(premium_user_required)):
-    session = SessionLocal()
-    runs = session.query(ExperimentRun).filter(ExperimentRun.experiment_id == experiment_id).order_by(ExperimentRun.date_ran.desc()).all()
-    session.close()
-    return [{
+async def list_experiment_runs(experiment_id: int, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                               user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """List an experiment's runs, newest first. With limit, returns one page and a next_cursor for the following page."""
+    query = select(ExperimentRun).where(ExperimentRun.experiment_id == experiment_id)
+    if limit is not None:
+        limit = check_limit(limit)
+        after = decode_cursor(cursor, datetime, int)
+        if after:
+            query = query.where(tuple_(ExperimentRun.date_ran, ExperimentRun.id) < tuple(after))
+        query = query.limit(limit + 1)
+    runs = (await session.scalars(query.order_by(ExperimentRun.date_ran.desc(), ExperimentRun.id.desc()))).all()
+
+    run_list = [{
         "id": r.id,
         "date_ran": r.date_ran,
         "model": r.model,
         "threshold": r.threshold,
         "labels_to_extract": r.labels_to_extract,
         "allow_multilabeling": r.allow_multilabeling
-    } for r in runs]
+    } for r in runs[:limit]]
+    if limit is None:
+        return run_list
+    return {"runs": run_list, "next_cursor": next_cursor(runs, limit, lambda r: (r.date_ran, r.id))}
+
+
+def same_labels(a: str, b: str) -> bool:
+    return sorted(label.strip() for label in a.split(",")) == sorted(label.strip() for label in b.split(","))
+
+async def find_previous_predictions(experiment_id: int, settings: dict, exclude_run_id: Optional[int] = None) -> dict:
+    """Stored result records of earlier runs of the experiment with the same settings, keyed by document text hash.
+
+    Newer runs take precedence. Empty predictions are skipped since a failed prediction is stored the same way,
+    and results stored before text hashes were recorded cannot be matched and are ignored.
+    """
+    threshold = settings["threshold"]
+    query = select(ExperimentRun.id, ExperimentRun.labels_to_extract).where(
+        ExperimentRun.experiment_id == experiment_id,
+        ExperimentRun.model == settings["model"],
+        ExperimentRun.allow_multilabeling == bool(settings["allow_multilabeling"]),
+        ExperimentRun.threshold.is_(None) if threshold is None else ExperimentRun.threshold == threshold
+    )
+    if exclude_run_id is not None:
+        query = query.where(ExperimentRun.id != exclude_run_id)
+    async with AsyncSessionLocal() as session:
+        runs = (await session.execute(query.order_by(ExperimentRun.date_ran.desc()))).all()
+
+    run_ids = [r.id for r in runs if same_labels(r.labels_to_extract, settings["labels_to_extract"])]
+    if not run_ids:
+        return {}
+
+    from result_store import fetch_result_records, migrate_legacy_results
+    await migrate_legacy_results(run_ids)
+    records_by_run = {}
+    async for record in fetch_result_records(run_ids):
+        records_by_run.setdefault(record["experiment_run_id"], []).append(record)
+
+    previous = {}
+    for run_id in reversed(run_ids):
+        for record in records_by_run.get(run_id, []):
+            if record.get("text_hash") and record["entity_count"]:
+                previous[record["text_hash"]] = record
+    return previous
+
+async def predict_documents(settings: dict, docs: list, previous: dict):
+    """Results for docs, reusing the stored predictions of unchanged texts from previous and predicting only the rest.
+
+    Returns (results, number of reused documents).
+    """
+    from helpers import predict_entities_batch, get_text_hash
+    from result_store import decode_predictions
+    hashes = [get_text_hash(d.text) for d in docs]
+    missing = [i for i, text_hash in enumerate(hashes) if text_hash not in previous]
 
+    predictions = [decode_predictions(previous[text_hash]) if text_hash in previous else None for text_hash in hashes]
+    if missing:
+        new_predictions = await predict_entities_batch(
+            settings["model"], settings["labels_to_extract"], [docs[i].text for i in missing],
+            settings["threshold"], settings["allow_multilabeling"]
+        )
+        for i, preds in zip(missing, new_predictions):
+            predictions[i] = preds
+
+    results = [
+        {"predictions": preds, "document_id": d.id, "document_title": d.title, "text_hash": text_hash}
+        for d, preds, text_hash in zip(docs, predictions, hashes)
+    ]
+    return results, len(docs) - len(missing)
 
 @router.post("/experiments/{experiment_id}/runs")
-async def add_experiment_run(experiment_id: int, data: dict, request: Request, user=Depends(premium_user_required)):
+async def add_experiment_run(experiment_id: int, data: dict, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
     model = data.get("model")
     labels_to_extract = data.get("labels_to_extract")
     allow_multilabeling = data.get("allow_multilabeling")
@@ -46,22 +130,21 @@ async def add_experiment_run(experiment_id: int, data: dict, request: Request, u
     if not model or labels_to_extract is None or allow_multilabeling is None:
         raise HTTPException(status_code=400, detail="Missing required fields")
     from documents import Document
-    session = SessionLocal()
-    docs = session.query(Document).filter(Document.experiment_id == experiment_id).all()
+    docs = (await session.execute(
+        select(Document.id, Document.title, Document.text).where(Document.experiment_id == experiment_id)
+    )).all()
+    # Hand the connection back to the pool while the model runs
+    await session.commit()
     
     if not docs:
         raise HTTPException(status_code=400, detail="No documents found for this experiment")
     
-    texts = [d.text for d in docs]
-    doc_ids = [d.id for d in docs]
-    doc_titles = [d.title for d in docs]
-    
+    settings = {"model": model, "labels_to_extract": labels_to_extract, "threshold": threshold, "allow_multilabeling": allow_multilabeling}
+    previous = await find_previous_predictions(experiment_id, settings) if data.get("incremental") else {}
+
     try:
-        from helpers import predict_entities_batch, initialize_mongodb
-        predictions = await predict_entities_batch(model, labels_to_extract, texts, threshold, allow_multilabeling)
-        results = []
-        for doc_id, doc_title, preds in zip(doc_ids, doc_titles, predictions):
-            results.append({"predictions": preds, "document_id": doc_id, "document_title": doc_title})
+        from result_store import store_results
+        results, reused = await predict_documents(settings, docs, previous)
         
         run = ExperimentRun(
             model=model,
@@ -72,16 +155,10 @@ async def add_experiment_run(experiment_id: int, data: dict, request: Request, u
             date_ran=datetime.utcnow()
         )
         session.add(run)
-        session.commit()
-        session.refresh(run)
+        await session.commit()
         run_id = run.id
-        session.close()
         
-        mongo_client = initialize_mongodb()
-        mongo_client.database.ExperimentResults.insert_one({
-            "experiment_run_id": run_id,
-            "results": results
-        })
+        await store_results(run_id, results)
         
         return {
             "id": run_id,
@@ -90,23 +167,130 @@ async def add_experiment_run(experiment_id: int, data: dict, request: Request, u
             "threshold": run.threshold,
             "labels_to_extract": run.labels_to_extract,
             "allow_multilabeling": run.allow_multilabeling,
+            "reused_documents": reused,
             "results": results
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Experiment failed: {str(e)}")
 
+async def fetch_document_batch(experiment_id: int, after_id: int, limit: int):
+    """Next documents of an experiment by id, so a run can walk any number of documents in constant memory."""
+    from documents import Document
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(
+            select(Document.id, Document.title, Document.text).where(
+                Document.experiment_id == experiment_id,
+                Document.id > after_id
+            ).order_by(Document.id).limit(limit)
+        )).all()
+
+async def run_document_batches(experiment_id: int, run: dict, after_id: int = 0, previous: Optional[dict] = None):
+    """Predict the experiment's documents after after_id batch by batch, storing each batch's results.
+
+    Documents whose text hash is in previous reuse those predictions instead of being predicted again.
+    Yields (last document id, batch results) once each batch is persisted.
+    """
+    from result_store import store_results
+    last_id = after_id
+    while True:
+        docs = await fetch_document_batch(experiment_id, last_id, constants.EXPERIMENT_BATCH_SIZE)
+        if not docs:
+            return
+        last_id = docs[-1].id
+
+        results, _ = await predict_documents(run, docs, previous or {})
+        await store_results(run["id"], results)
+        yield last_id, results
+
+def format_stream_event(event: dict, server_sent_events: bool) -> str:
+    payload = json.dumps(event, default=str)
+    if server_sent_events:
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+async def prepare_run(experiment_id: int, data: dict) -> dict:
+    """Validate run settings, then create the run row, returning the run's details."""
+    model = data.get("model")
+    labels_to_extract = data.get("labels_to_extract")
+    allow_multilabeling = data.get("allow_multilabeling")
+    threshold = data.get("threshold") or None
+    if not model or labels_to_extract is None or allow_multilabeling is None:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    if not await fetch_document_batch(experiment_id, 0, 1):
+        raise HTTPException(status_code=400, detail="No documents found for this experiment")
+
+    from helpers import parse_entity_types
+    parse_entity_types(labels_to_extract)
+
+    run = ExperimentRun(
+        model=model,
+        labels_to_extract=labels_to_extract,
+        allow_multilabeling=allow_multilabeling,
+        threshold=threshold,
+        experiment_id=experiment_id,
+        date_ran=datetime.utcnow()
+    )
+    async with AsyncSessionLocal() as session:
+        session.add(run)
+        await session.commit()
+    run_info = {
+        "id": run.id,
+        "date_ran": run.date_ran,
+        "model": run.model,
+        "threshold": run.threshold,
+        "labels_to_extract": run.labels_to_extract,
+        "allow_multilabeling": run.allow_multilabeling
+    }
+    return run_info
+
+@router.post("/experiments/{experiment_id}/runs/stream")
+async def stream_experiment_run(experiment_id: int, data: dict, request: Request, user=Depends(premium_user_required)):
+    """Run an experiment and stream per-document predictions as NDJSON (or SSE with Accept: text/event-stream) as each batch finishes."""
+    run_info = await prepare_run(experiment_id, data)
+    server_sent_events = "text/event-stream" in request.headers.get("accept", "")
+
+    async def generate():
+        yield format_stream_event({"type": "run", **run_info}, server_sent_events)
+        processed = 0
+        try:
+            previous = await find_previous_predictions(experiment_id, run_info, exclude_run_id=run_info["id"]) if data.get("incremental") else None
+            async for _, results in run_document_batches(experiment_id, run_info, previous=previous):
+                for result in results:
+                    yield format_stream_event({"type": "result", **result}, server_sent_events)
+                processed += len(results)
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield format_stream_event({"type": "error", "detail": f"Experiment failed: {detail}", "processed": processed}, server_sent_events)
+            return
+
+        yield format_stream_event({"type": "done", "processed": processed}, server_sent_events)
+
+    media_type = "text/event-stream" if server_sent_events else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type)
+
 @router.get("/experiment-runs/{run_id}/results")
-async def get_experiment_run_results(run_id: int, request: Request, user=Depends(premium_user_required)):
-    from helpers import initialize_mongodb
-    mongo_client = initialize_mongodb()
-    
-    result = mongo_client.database.ExperimentResults.find_one({"experiment_run_id": run_id})
-    
-    if not result:
+async def get_experiment_run_results(run_id: int, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                                     document_id: Optional[int] = None, label: Optional[str] = None,
+                                     user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """Results of a run ordered by document id, optionally only for one document or only entities with a label.
+    With limit, returns one page and a next_cursor for the following page."""
+    if not await session.get(ExperimentRun, run_id):
         raise HTTPException(status_code=404, detail="Experiment run results not found")
-    
+    await session.commit()
+
+    from result_store import fetch_results, migrate_legacy_results
+    await migrate_legacy_results([run_id])
+    if limit is None:
+        return {"experiment_run_id": run_id, "results": await fetch_results(run_id, document_id=document_id, label=label)}
+
+    limit = check_limit(limit)
+    after = decode_cursor(cursor, int)
+    results = await fetch_results(run_id, limit + 1, after[0] if after else None, document_id, label)
     return {
         "experiment_run_id": run_id,
-        "results": result["results"]
+        "results": results[:limit],
+        "next_cursor": next_cursor(results, limit, lambda r: (r["document_id"],))
     }
@@ -1,40 +1,52 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import create_engine, Column, Integer, String, select
-from sqlalchemy.orm import declarative_base, sessionmaker
-import os
+from sqlalchemy import Column, Integer, String, Index, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import random
 from constants import EXPERIMENT_IMAGE_URLS
 from utils import premium_user_required
+from database import Base, engine, ensure_indexes, get_session
+from pagination import check_limit, decode_cursor, next_cursor
 
 EXPERIMENTS_TABLE_NAME = "experiments"
-DATABASE_URL = os.getenv("POSTGRES_URL")
-
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-
-Base = declarative_base()
-SessionLocal = sessionmaker(bind=engine)
 
 class Experiment(Base):
     __tablename__ = EXPERIMENTS_TABLE_NAME
-    __table_args__ = {"schema": "experiments"}
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     image_url = Column(String, nullable=False)
     user_id = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index("ix_experiments_user_id_id", "user_id", "id"),
+        {"schema": "experiments"}
+    )
+
 Base.metadata.create_all(bind=engine)
+ensure_indexes(Experiment.__table__)
 
 router = APIRouter()
 
 @router.get("/experiments")
-async def list_experiments(request: Request, user=Depends(premium_user_required)):
-    session = SessionLocal()
-    experiments = session.query(Experiment).filter(Experiment.user_id == user["id"]).all()
-    session.close()
-    return [{"id": e.id, "name": e.name, "image_url": e.image_url} for e in experiments]
+async def list_experiments(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                           user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """List the user's experiments. With limit, returns one page ordered by id and a next_cursor for the following page."""
+    query = select(Experiment.id, Experiment.name, Experiment.image_url).where(Experiment.user_id == user["id"])
+    if limit is not None:
+        limit = check_limit(limit)
+        after = decode_cursor(cursor, int)
+        if after:
+            query = query.where(Experiment.id > after[0])
+        query = query.limit(limit + 1)
+    experiments = (await session.execute(query.order_by(Experiment.id))).all()
+
+    experiment_list = [{"id": e.id, "name": e.name, "image_url": e.image_url} for e in experiments[:limit]]
+    if limit is None:
+        return experiment_list
+    return {"experiments": experiment_list, "next_cursor": next_cursor(experiments, limit, lambda e: (e.id,))}
 
 @router.post("/experiments")
-async def create_experiment(data: dict, request: Request, user=Depends(premium_user_required)):
+async def create_experiment(data: dict, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
     name = data.get("name")
     if not name:
         raise HTTPException(status_code=400, detail="Experiment name required")
@@ -42,22 +54,16 @@ async def create_experiment(data: dict, request: Request, user=Depends(premium_u
     custom_image_url = data.get("image_url")
     image_url = custom_image_url if custom_image_url else random.choice(EXPERIMENT_IMAGE_URLS)
     
-    session = SessionLocal()
     experiment = Experiment(name=name, image_url=image_url, user_id=user["id"])
     session.add(experiment)
-    session.commit()
-    session.refresh(experiment)
-    session.close()
+    await session.commit()
     return {"id": experiment.id, "name": experiment.name, "image_url": experiment.image_url}
 
 @router.delete("/experiments/{experiment_id}")
-async def delete_experiment(experiment_id: int, request: Request, user=Depends(premium_user_required)):
-    session = SessionLocal()
-    experiment = session.query(Experiment).filter(Experiment.id == experiment_id, Experiment.user_id == user["id"]).first()
+async def delete_experiment(experiment_id: int, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    experiment = await session.scalar(select(Experiment).where(Experiment.id == experiment_id, Experiment.user_id == user["id"]))
     if not experiment:
-        session.close()
         raise HTTPException(status_code=404, detail="Experiment not found or not owned by user")
-    session.delete(experiment)
-    session.commit()
-    session.close()
+    await session.delete(experiment)
+    await session.commit()
     return {"success": True, "message": "Experiment deleted"}
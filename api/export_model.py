@@ -0,0 +1,103 @@
+"""Export the served GLiNER models to ONNX and check the accuracy of alternative backends.
+
+Usage:
+    python export_model.py export regular-gliner --quantize
+    python export_model.py check regular-gliner --backend onnx-int8
+
+Exports are written to ONNX_MODELS_DIR/<model name>, where the API loads them when
+MODEL_BACKENDS selects "onnx" or "onnx-int8" for that model. The check compares a backend's
+predictions against the full-precision PyTorch model on new_data/small_processed_output.json.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+import constants
+from model_backends import BACKENDS, TORCH_BACKEND, load_gliner
+from model_registry import MODEL_PATHS
+
+DEFAULT_PARITY_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "new_data", "small_processed_output.json")
+
+def export(name: str, quantize: bool):
+    model = load_gliner(MODEL_PATHS[name], TORCH_BACKEND, "")
+    if not hasattr(model, "export_to_onnx"):
+        sys.exit("The installed gliner version cannot export to ONNX, upgrade gliner first")
+
+    save_dir = os.path.join(constants.ONNX_MODELS_DIR, name)
+    paths = model.export_to_onnx(save_dir, quantize=quantize)
+    print(f"Exported {name}: {paths}")
+
+def load_parity_examples(data_path: str, limit: int) -> List[dict]:
+    with open(data_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    examples = []
+    for example in data[:limit]:
+        labels = sorted({label for _, _, label in example["ner"]})[:constants.MAX_ENTITY_TYPES]
+        if labels:
+            examples.append({"text": " ".join(example["tokenized_text"]), "labels": labels})
+    return examples
+
+def predict_all(model, examples: List[dict], threshold: float):
+    start = time.perf_counter()
+    predictions = [model.predict_entities(example["text"], example["labels"], threshold=threshold) for example in examples]
+    return predictions, time.perf_counter() - start
+
+def check(name: str, backend: str, data_path: str, limit: int, threshold: float, min_f1: float):
+    examples = load_parity_examples(data_path, limit)
+    reference_model = load_gliner(MODEL_PATHS[name], TORCH_BACKEND, "")
+    candidate_model = load_gliner(MODEL_PATHS[name], backend, os.path.join(constants.ONNX_MODELS_DIR, name))
+
+    reference, reference_seconds = predict_all(reference_model, examples, threshold)
+    candidate, candidate_seconds = predict_all(candidate_model, examples, threshold)
+
+    matched = reference_total = candidate_total = 0
+    score_diffs = []
+    for reference_entities, candidate_entities in zip(reference, candidate):
+        reference_spans = {(e["start"], e["end"], e["label"]): e["score"] for e in reference_entities}
+        candidate_spans = {(e["start"], e["end"], e["label"]): e["score"] for e in candidate_entities}
+        shared = reference_spans.keys() & candidate_spans.keys()
+        matched += len(shared)
+        reference_total += len(reference_spans)
+        candidate_total += len(candidate_spans)
+        score_diffs.extend(abs(reference_spans[span] - candidate_spans[span]) for span in shared)
+
+    precision = matched / candidate_total if candidate_total else 1.0
+    recall = matched / reference_total if reference_total else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    print(f"Examples: {len(examples)}")
+    print(f"Span agreement with torch: precision={precision:.4f} recall={recall:.4f} f1={f1:.4f}")
+    if score_diffs:
+        print(f"Score difference on shared spans: mean={sum(score_diffs) / len(score_diffs):.4f} max={max(score_diffs):.4f}")
+    print(f"Latency: torch={reference_seconds:.2f}s {backend}={candidate_seconds:.2f}s ({reference_seconds / candidate_seconds:.2f}x)")
+
+    if f1 < min_f1:
+        sys.exit(f"Backend '{backend}' is below the required agreement (f1 {f1:.4f} < {min_f1})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a model to ONNX")
+    export_parser.add_argument("model", choices=list(MODEL_PATHS))
+    export_parser.add_argument("--quantize", action="store_true", help="Also write an int8-quantized ONNX model")
+
+    check_parser = subparsers.add_parser("check", help="Compare a backend against the PyTorch model")
+    check_parser.add_argument("model", choices=list(MODEL_PATHS))
+    check_parser.add_argument("--backend", choices=[b for b in BACKENDS if b != TORCH_BACKEND], required=True)
+    check_parser.add_argument("--data", default=DEFAULT_PARITY_DATA)
+    check_parser.add_argument("--limit", type=int, default=100)
+    check_parser.add_argument("--threshold", type=float, default=0.5)
+    check_parser.add_argument("--min-f1", type=float, default=0.95)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export(args.model, args.quantize)
+    else:
+        check(args.model, args.backend, args.data, args.limit, args.threshold, args.min_f1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Local stand-in for the Gemini generateContent API, used for tests and throughput benchmarks.
+
+Run it with `uvicorn fake_gemini_server:app --port 8001` and point the API at it with
+GEMINI_BASE_URL=http://localhost:8001 (any GEMINI_API_KEY value is accepted).
+"""
+import asyncio
+import json
+import os
+import re
+from fastapi import FastAPI, Request
+
+FAKE_GEMINI_LATENCY_MS = float(os.getenv("FAKE_GEMINI_LATENCY_MS", "200"))
+
+app = FastAPI()
+app.state.request_count = 0
+
+def build_fake_entities(prompt: str) -> list:
+    """Tag the first word of the text with every requested entity type."""
+    text_match = re.search(r'Text: "(.*?)"\s*Please identify', prompt, re.DOTALL)
+    labels_match = re.search(r"Extract the following entity types from the given text: (.*?)\.\n", prompt)
+    if not text_match or not labels_match:
+        return []
+
+    text = text_match.group(1)
+    word_match = re.search(r"\w+", text)
+    if not word_match:
+        return []
+
+    return [
+        {
+            "text": word_match.group(),
+            "label": label.strip(),
+            "start": word_match.start() + 1,
+            "end": word_match.end(),
+            "score": 0.9,
+        }
+        for label in labels_match.group(1).split(",")
+    ]
+
+@app.post("/{api_version}/models/{model_action}")
+async def generate_content(api_version: str, model_action: str, request: Request):
+    body = await request.json()
+    prompt = "".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+    app.state.request_count += 1
+    await asyncio.sleep(FAKE_GEMINI_LATENCY_MS / 1000)
+
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": json.dumps(build_fake_entities(prompt))}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0},
+    }
+
+@app.get("/stats")
+async def stats():
+    return {"request_count": app.state.request_count}
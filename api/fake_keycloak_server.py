@@ -0,0 +1,119 @@
+"""Local stand-in for the Keycloak realm endpoints the API uses, for tests and benchmarks.
+
+Run it with `uvicorn fake_keycloak_server:app --port 8002` and point the API at it with
+KEYCLOAK_SERVER_URL=http://localhost:8002. Tokens signed by its key are minted with
+GET /mint?sub=...&email=...&roles=premium_user. Setting FAKE_KEYCLOAK_JWKS_FILE also writes
+the public keys to that file, which the API reads when KEYCLOAK_JWKS_FILE points at it.
+
+The admin token grant and the realm role endpoints used for subscriptions are stubbed too, with
+role mappings kept in memory; GET /stats reports how many requests each endpoint received.
+"""
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI, HTTPException, Request
+from jwt.algorithms import RSAAlgorithm
+
+FAKE_KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "gliner")
+FAKE_KEYCLOAK_JWKS_FILE = os.getenv("FAKE_KEYCLOAK_JWKS_FILE")
+FAKE_KEYCLOAK_KEY_ID = "fake-keycloak-key"
+FAKE_KEYCLOAK_ROLES = {"premium_user", "free_user"}
+FAKE_ADMIN_TOKEN_SECONDS = int(os.getenv("FAKE_ADMIN_TOKEN_SECONDS", "60"))
+
+signing_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def get_jwks() -> dict:
+    public_jwk = json.loads(RSAAlgorithm.to_jwk(signing_key.public_key()))
+    public_jwk.update({"kid": FAKE_KEYCLOAK_KEY_ID, "use": "sig", "alg": "RS256"})
+    return {"keys": [public_jwk]}
+
+def mint_token(sub: str, email: str, roles: list, expires_in: int = 300) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": f"http://localhost/realms/{FAKE_KEYCLOAK_REALM}",
+        "sub": sub,
+        "email": email,
+        "preferred_username": email.split("@")[0],
+        "iat": now,
+        "exp": now + expires_in,
+        "realm_access": {"roles": roles},
+    }
+    return jwt.encode(claims, signing_key, algorithm="RS256", headers={"kid": FAKE_KEYCLOAK_KEY_ID})
+
+if FAKE_KEYCLOAK_JWKS_FILE:
+    with open(FAKE_KEYCLOAK_JWKS_FILE, "w", encoding="utf-8") as f:
+        json.dump(get_jwks(), f)
+
+app = FastAPI()
+app.state.stats = Counter()
+app.state.admin_tokens = set()
+app.state.refresh_tokens = set()
+app.state.role_mappings = {}
+
+@app.get("/realms/{realm}/protocol/openid-connect/certs")
+async def certs(realm: str):
+    return get_jwks()
+
+@app.get("/mint")
+async def mint(sub: str = None, email: str = "user@example.com", roles: str = "", expires_in: int = 300):
+    return {"access_token": mint_token(sub or str(uuid.uuid4()), email, [r for r in roles.split(",") if r], expires_in)}
+
+@app.post("/realms/master/protocol/openid-connect/token")
+async def admin_token(request: Request):
+    form = {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+    grant_type = form.get("grant_type")
+    app.state.stats[f"token_{grant_type}"] += 1
+    if grant_type == "refresh_token" and form.get("refresh_token") not in app.state.refresh_tokens:
+        raise HTTPException(status_code=400, detail="invalid_grant")
+    if grant_type not in ("password", "refresh_token"):
+        raise HTTPException(status_code=400, detail="unsupported_grant_type")
+
+    access_token, refresh_token = str(uuid.uuid4()), str(uuid.uuid4())
+    app.state.admin_tokens.add(access_token)
+    app.state.refresh_tokens.add(refresh_token)
+    return {
+        "access_token": access_token,
+        "expires_in": FAKE_ADMIN_TOKEN_SECONDS,
+        "refresh_token": refresh_token,
+        "refresh_expires_in": FAKE_ADMIN_TOKEN_SECONDS * 30,
+    }
+
+def check_admin(request: Request, endpoint: str):
+    app.state.stats[endpoint] += 1
+    if request.headers.get("Authorization", "").removeprefix("Bearer ") not in app.state.admin_tokens:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.get("/admin/realms/{realm}/roles/{role_name}")
+async def get_role(realm: str, role_name: str, request: Request):
+    check_admin(request, "get_role")
+    if role_name not in FAKE_KEYCLOAK_ROLES:
+        raise HTTPException(status_code=404, detail="Role not found")
+    return {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, role_name)), "name": role_name}
+
+@app.get("/admin/realms/{realm}/users/{user_id}/role-mappings/realm")
+async def get_role_mappings(realm: str, user_id: str, request: Request):
+    check_admin(request, "get_role_mappings")
+    return list(app.state.role_mappings.get(user_id, {}).values())
+
+@app.post("/admin/realms/{realm}/users/{user_id}/role-mappings/realm")
+async def add_role_mappings(realm: str, user_id: str, request: Request):
+    check_admin(request, "add_role_mappings")
+    for role in await request.json():
+        app.state.role_mappings.setdefault(user_id, {})[role["name"]] = role
+    return None
+
+@app.delete("/admin/realms/{realm}/users/{user_id}/role-mappings/realm")
+async def delete_role_mappings(realm: str, user_id: str, request: Request):
+    check_admin(request, "delete_role_mappings")
+    for role in await request.json():
+        app.state.role_mappings.get(user_id, {}).pop(role["name"], None)
+    return None
+
+@app.get("/stats")
+async def stats():
+    return dict(app.state.stats)
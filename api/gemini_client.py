@@ -19,22 +19,28 @@ class EntityResult:
     score: float
  
 class RateLimiter:
+    """Async-safe token bucket allowing bursts of max_requests, refilled evenly over time_window seconds."""
+
     def __init__(self, max_requests: int = 15, time_window: int = 60):
         self.max_requests = max_requests
         self.time_window = time_window
-        self.requests = []
-   
+        self.tokens = float(max_requests)
+        self.refill_rate = max_requests / time_window
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_requests, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
     async def acquire(self):
-        now = time.time()
-        self.requests = [req_time for req_time in self.requests if now - req_time < self.time_window]
-       
-        if len(self.requests) >= self.max_requests:
-            wait_time = self.time_window - (now - self.requests[0]) + 1
-            await asyncio.sleep(wait_time)
-            now = time.time()
-            self.requests = [req_time for req_time in self.requests if now - req_time < self.time_window]
-       
-        self.requests.append(now)
+        async with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+                self._refill()
+            self.tokens -= 1
  
 class GeminiClient:
     def __init__(self):
@@ -42,8 +48,11 @@ class GeminiClient:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
        
-        self.client = genai.Client(api_key=self.api_key)
-        self.rate_limiter = RateLimiter(max_requests=15, time_window=60)
+        base_url = os.getenv("GEMINI_BASE_URL")
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self.client = genai.Client(api_key=self.api_key, http_options=http_options)
+        self.rate_limiter = RateLimiter(max_requests=constants.GEMINI_MAX_REQUESTS_PER_MINUTE, time_window=60)
+        self.semaphore = asyncio.Semaphore(constants.GEMINI_MAX_CONCURRENCY)
         self.words_splitter = WordsSplitter("whitespace")
    
     def _create_ner_prompt(self, text: str, entity_types: List[str], threshold: float = 0.5, multi_label: bool = False) -> str:
@@ -166,7 +175,7 @@ class GeminiClient:
         try:
             prompt = self._create_ner_prompt(text, entity_types, threshold, multi_label)
            
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model="gemini-2.5-flash-lite",
                 contents=prompt,
                 config=types.GenerateContentConfig(
@@ -195,6 +204,19 @@ class GeminiClient:
         except Exception as e:
             print(f"Error calling Gemini API: {e}")
             return []
+
+    async def predict_entities_many(self, texts: List[str], entity_types: List[str], threshold: float = 0.5, multi_label: bool = False) -> List[List[Dict[str, Any]]]:
+        """Predict entities for several texts concurrently, bounded by the client's semaphore."""
+        async def predict_one(text: str) -> List[Dict[str, Any]]:
+            async with self.semaphore:
+                return await self.predict_entities(text, entity_types, threshold=threshold, multi_label=multi_label)
+
+        results = await asyncio.gather(*(predict_one(text) for text in texts), return_exceptions=True)
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"Error processing text with Gemini: {result}")
+                results[i] = []
+        return results
  
 gemini_client = None
  
@@ -1,14 +1,12 @@
-from typing import List, Optional, Union
+from typing import List, Union
 from fastapi import HTTPException
 from gliner import GLiNER
 import constants
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from pymongo.errors import ConnectionFailure
 from datetime import datetime
-import os
 import hashlib
 from gemini_client import get_gemini_client
+from inference_executor import get_inference_executor
+from model_registry import get_model_registry
 
 
 def parse_entity_types(raw: str) -> List[str]:
@@ -31,102 +29,110 @@ def parse_entity_types(raw: str) -> List[str]:
         raise HTTPException(status_code=400, detail=f"Invalid entity type names: {invalid}")
     return unique
 
-MODEL_REGISTRY = {}
-def get_model(name: str) -> Union[GLiNER, str]:
+async def get_model(name: str) -> Union[GLiNER, str]:
+    """Get a model for a request; every call must be paired with release_model once inference is done."""
     if name == constants.GEMINI_MODEL_NAME_FRONTEND:
         return "gemini"
-    elif name not in MODEL_REGISTRY:
-        if name == constants.DEFAULT_MODEL_NAME_FRONTEND:
-            path = constants.DEFAULT_MODEL_NAME
-        elif name == constants.FINETUNED_MODEL_NAME_FRONTEND:
-            path = constants.FINETUNED_MODEL_NAME
-        else:
-            raise HTTPException(status_code=400, detail=f"Model '{name}' not available")
-        MODEL_REGISTRY[name] = GLiNER.from_pretrained(path, local_files_only=False)
-    return MODEL_REGISTRY[name]
+    return await get_model_registry().acquire(name)
 
-client_texts_collection: Optional[Collection] = None
-def initialize_mongodb() -> Optional[Collection]:
-    global client_texts_collection
-
-    if client_texts_collection is not None:
-        return client_texts_collection
-
-    try:
-        mongo_url = os.getenv("MONGO_URL")
-        mongo_db_name = os.getenv("MONGO_DB_NAME")
-        mongo_collection_name = os.getenv("MONGO_COLLECTION_NAME")
-        
-        mongo_client = MongoClient(mongo_url)
-        db = mongo_client[mongo_db_name]
-        client_texts_collection = db[mongo_collection_name]
-                
-        return client_texts_collection
-    except Exception as e:
-        raise HTTPException(
-            status_code=503, 
-            detail="Database connection failed."
-        )
+def release_model(name: str):
+    if name != constants.GEMINI_MODEL_NAME_FRONTEND:
+        get_model_registry().release(name)
 
+def run_gliner_batch(model: GLiNER, texts: List[str], entity_types: List[str], threshold: float, multi_label: bool) -> List[list]:
+    """Run several texts through GLiNER in a single batched forward pass."""
+    if hasattr(model, "inference"):
+        return model.inference(texts, entity_types, threshold=threshold, multi_label=multi_label, batch_size=len(texts))
+    return model.batch_predict_entities(texts, entity_types, threshold=threshold, multi_label=multi_label, batch_size=len(texts))
 
 def get_text_hash(text: str) -> str:
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 
-def store_training_text(text: str) -> bool:
-    collection = initialize_mongodb()
-    
-    try:
-        text_hash = get_text_hash(text)
-        
-        existing = collection.find_one({"text_hash": text_hash})
-        if existing:
-            return False
-        
-        training_document = {
-            "text": text,
-            "text_hash": text_hash,
-        }
-        
-        result = collection.insert_one(training_document)
-        return True
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=503, 
-            detail="Failed to store text for training."
-        )
-
 async def predict_entities_batch(model_name: str, entity_types_raw: str, texts: list, threshold: float, allow_multi_label: bool):
+    from prediction_cache import get_prediction_cache
     entity_types = parse_entity_types(entity_types_raw)
-    model = get_model(model_name)
-    results = []
-    
+    cache = get_prediction_cache()
+
+    keys = [cache.make_key(model_name, text, entity_types, threshold, allow_multi_label) for text in texts]
+    results = [await cache.get(key) for key in keys]
+    missing = [i for i, entities in enumerate(results) if entities is None]
+    if missing:
+        model = await get_model(model_name)
+        try:
+            predictions = await predict_uncached_batch(model_name, model, entity_types, [texts[i] for i in missing], threshold, allow_multi_label)
+        finally:
+            release_model(model_name)
+        for i, entities in zip(missing, predictions):
+            results[i] = entities
+            await cache.set(keys[i], entities)
+    return results
+
+async def predict_uncached_batch(model_name: str, model: Union[GLiNER, str], entity_types: List[str], texts: list, threshold: float, allow_multi_label: bool):
     if model == "gemini":
         gemini_client = get_gemini_client()
-        for text in texts:
-            try:
-                entities = await gemini_client.predict_entities(
-                    text,
-                    entity_types,
-                    threshold=threshold,
-                    multi_label=allow_multi_label,
-                )
-                results.append(entities)
-            except Exception as e:
-                print(f"Error processing text with Gemini: {e}")
-                results.append([])
+        results = await gemini_client.predict_entities_many(
+            texts,
+            entity_types,
+            threshold=threshold,
+            multi_label=allow_multi_label,
+        )
     else:
-        for text in texts:
-            try:
-                entities = model.predict_entities(
-                    text,
-                    entity_types,
-                    threshold=threshold,
-                    multi_label=allow_multi_label,
-                )
-                results.append(entities)
-            except Exception as e:
-                print(f"Error processing text with GLiNER: {e}")
-                results.append([]) 
-    return results
\ No newline at end of file
+        from chunking import predict_windowed
+        results = await predict_windowed(
+            texts,
+            lambda window_texts: predict_gliner_texts(model_name, model, entity_types, window_texts, threshold, allow_multi_label),
+            allow_multi_label,
+        )
+    return results
+
+async def predict_gliner_texts(model_name: str, model: GLiNER, entity_types: List[str], texts: list, threshold: float, allow_multi_label: bool):
+    from span_cache import predict_with_span_cache, supports_span_cache
+    if supports_span_cache(model, threshold):
+        return await predict_with_span_cache(model_name, model, entity_types, texts, threshold, allow_multi_label)
+    predictions = await run_sorted_batches(model_name, model, texts, entity_types, threshold, allow_multi_label)
+    return [entities if entities is not None else [] for entities in predictions]
+
+async def run_sorted_batches(model_name: str, model: GLiNER, texts: list, entity_types: List[str], threshold: float, allow_multi_label: bool) -> list:
+    """Run texts through GLiNER in length-sorted batches; texts that fail on their own come back as None."""
+    executor = get_inference_executor()
+    results = [None for _ in texts]
+    # Sorting by length keeps texts of similar size together, which limits padding in each batch
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), constants.EXPERIMENT_BATCH_SIZE):
+        indices = order[start:start + constants.EXPERIMENT_BATCH_SIZE]
+        batch_texts = [texts[i] for i in indices]
+        try:
+            batch_entities = await executor.run(
+                model_name,
+                run_gliner_batch,
+                model,
+                batch_texts,
+                entity_types,
+                threshold,
+                allow_multi_label,
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error processing batch with GLiNER, retrying documents one by one: {e}")
+            batch_entities = []
+            for text in batch_texts:
+                try:
+                    batch_entities.append((await executor.run(
+                        model_name,
+                        run_gliner_batch,
+                        model,
+                        [text],
+                        entity_types,
+                        threshold,
+                        allow_multi_label,
+                    ))[0])
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    print(f"Error processing text with GLiNER: {e}")
+                    batch_entities.append(None)
+        for i, entities in zip(indices, batch_entities):
+            results[i] = entities
+    return results
@@ -0,0 +1,63 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Callable, Dict
+from fastapi import HTTPException
+import constants
+
+# Set by background work (experiment jobs), which should slow down under load rather than fail
+wait_when_busy: ContextVar[bool] = ContextVar("wait_when_busy", default=False)
+
+class InferenceExecutor:
+    """Runs blocking model inference on dedicated per-model worker threads with a bounded queue."""
+
+    def __init__(self, workers_per_model: int = constants.INFERENCE_WORKERS_PER_MODEL, max_queue_size: int = constants.INFERENCE_MAX_QUEUE_SIZE):
+        self.workers_per_model = workers_per_model
+        self.max_queue_size = max_queue_size
+        self.pools: Dict[str, ThreadPoolExecutor] = {}
+        self.queued: Dict[str, int] = {}
+        self.closed = False
+
+    def _get_pool(self, model_name: str) -> ThreadPoolExecutor:
+        if model_name not in self.pools:
+            self.pools[model_name] = ThreadPoolExecutor(
+                max_workers=self.workers_per_model,
+                thread_name_prefix=f"inference-{model_name}",
+            )
+        return self.pools[model_name]
+
+    async def run(self, model_name: str, fn: Callable, *args):
+        """Run fn(*args) on the model's worker pool, rejecting with 503 when its queue is full,
+        or waiting for room in it when wait_when_busy is set."""
+        backoff = 0.05
+        while True:
+            if self.closed:
+                raise HTTPException(status_code=503, detail="Inference service is shutting down")
+            if self.queued.get(model_name, 0) < self.max_queue_size:
+                break
+            if not wait_when_busy.get():
+                raise HTTPException(status_code=503, detail=f"Model '{model_name}' is busy, please retry later")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, constants.INFERENCE_BUSY_MAX_BACKOFF_SECONDS)
+
+        self.queued[model_name] = self.queued.get(model_name, 0) + 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(model_name), fn, *args)
+        finally:
+            self.queued[model_name] -= 1
+
+    async def shutdown(self):
+        """Cancel queued work and wait for running forward passes in a thread, keeping the event loop free."""
+        self.closed = True
+        pools = list(self.pools.values())
+        self.pools.clear()
+        await asyncio.gather(*[asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True) for pool in pools])
+
+inference_executor = None
+
+def get_inference_executor() -> InferenceExecutor:
+    global inference_executor
+    if inference_executor is None:
+        inference_executor = InferenceExecutor()
+    return inference_executor
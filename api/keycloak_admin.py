@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+KEYCLOAK_SERVER_URL = os.getenv("KEYCLOAK_SERVER_URL")
+KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM")
+KEYCLOAK_ADMIN_USER = os.getenv("KEYCLOAK_ADMIN_USER")
+KEYCLOAK_ADMIN_PASSWORD = os.getenv("KEYCLOAK_ADMIN_PASSWORD")
+
+# Tokens are renewed this long before they expire, so a request never goes out with a token about to lapse
+TOKEN_EXPIRY_MARGIN_SECONDS = 30
+KEYCLOAK_HTTP_TIMEOUT_SECONDS = 10
+KEYCLOAK_MAX_CONNECTIONS = 20
+
+class KeycloakAdminClient:
+    """Keycloak admin REST client over one pooled keep-alive connection set.
+
+    The admin access token is reused until shortly before it expires, then renewed with the
+    refresh token (falling back to the password grant). Role representations are cached by name,
+    since realm role ids never change.
+    """
+
+    def __init__(self, server_url: str = KEYCLOAK_SERVER_URL, realm: str = KEYCLOAK_REALM,
+                 admin_user: str = KEYCLOAK_ADMIN_USER, admin_password: str = KEYCLOAK_ADMIN_PASSWORD):
+        self.server_url = server_url
+        self.realm = realm
+        self.admin_user = admin_user
+        self.admin_password = admin_password
+        self.client: Optional[httpx.AsyncClient] = None
+        self.token: Optional[str] = None
+        self.token_expires_at = 0.0
+        self.refresh_token: Optional[str] = None
+        self.refresh_expires_at = 0.0
+        self.token_lock = asyncio.Lock()
+        self.roles: Dict[str, dict] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.server_url,
+                timeout=KEYCLOAK_HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=KEYCLOAK_MAX_CONNECTIONS, max_keepalive_connections=KEYCLOAK_MAX_CONNECTIONS),
+            )
+        return self.client
+
+    async def _request_token(self):
+        now = time.monotonic()
+        if self.refresh_token and now < self.refresh_expires_at - TOKEN_EXPIRY_MARGIN_SECONDS:
+            data = {"grant_type": "refresh_token", "client_id": "admin-cli", "refresh_token": self.refresh_token}
+        else:
+            data = {"grant_type": "password", "client_id": "admin-cli", "username": self.admin_user, "password": self.admin_password}
+
+        response = await self._get_client().post("/realms/master/protocol/openid-connect/token", data=data)
+        if response.status_code in (400, 401) and data["grant_type"] == "refresh_token":
+            # The refresh token was revoked (e.g. the admin session ended), start a new session
+            self.refresh_token = None
+            return await self._request_token()
+        response.raise_for_status()
+
+        token_data = response.json()
+        self.token = token_data["access_token"]
+        self.token_expires_at = now + token_data.get("expires_in", 60)
+        self.refresh_token = token_data.get("refresh_token")
+        self.refresh_expires_at = now + token_data.get("refresh_expires_in", 0)
+
+    async def get_admin_token(self, force_refresh: bool = False) -> str:
+        """Get admin access token from Keycloak"""
+        if not force_refresh and self.token and time.monotonic() < self.token_expires_at - TOKEN_EXPIRY_MARGIN_SECONDS:
+            return self.token
+        async with self.token_lock:
+            if force_refresh or not self.token or time.monotonic() >= self.token_expires_at - TOKEN_EXPIRY_MARGIN_SECONDS:
+                try:
+                    await self._request_token()
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Failed to get admin token: {str(e)}")
+            return self.token
+
+    async def _admin_request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        token = await self.get_admin_token()
+        response = await self._get_client().request(method, f"/admin/realms/{self.realm}{path}", headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            # The token was revoked before its expiry, get a new one and retry once
+            token = await self.get_admin_token(force_refresh=True)
+            response = await self._get_client().request(method, f"/admin/realms/{self.realm}{path}", headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def get_role(self, role_name: str) -> dict:
+        if role_name not in self.roles:
+            role_data = (await self._admin_request("GET", f"/roles/{role_name}")).json()
+            self.roles[role_name] = {"id": role_data["id"], "name": role_data["name"]}
+        return self.roles[role_name]
+
+    async def assign_role(self, user_id: str, role_name: str):
+        """Assign a realm role to a user"""
+        try:
+            role = await self.get_role(role_name)
+            await self._admin_request("POST", f"/users/{user_id}/role-mappings/realm", json=[role])
+            return {
+                "success": True,
+                "message": f"Role {role_name} assigned successfully",
+                "assigned_role": role_name
+            }
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise HTTPException(status_code=404, detail=f"Role '{role_name}' or user not found")
+            else:
+                raise HTTPException(status_code=500, detail=f"Failed to assign role: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error assigning role: {str(e)}")
+
+    async def remove_role(self, user_id: str, role_name: str):
+        """Remove a specific role from a user"""
+        try:
+            role = await self.get_role(role_name)
+            await self._admin_request("DELETE", f"/users/{user_id}/role-mappings/realm", json=[role])
+            return {
+                "success": True,
+                "message": f"Role {role_name} removed successfully",
+                "removed_role": role_name
+            }
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise HTTPException(status_code=404, detail=f"Role '{role_name}' or user not found")
+            else:
+                raise HTTPException(status_code=500, detail=f"Failed to remove role: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error removing role: {str(e)}")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+keycloak_admin_client = None
+
+def get_keycloak_admin_client() -> KeycloakAdminClient:
+    global keycloak_admin_client
+    if keycloak_admin_client is None:
+        keycloak_admin_client = KeycloakAdminClient()
+    return keycloak_admin_client
+
+async def get_keycloak_admin_token() -> str:
+    return await get_keycloak_admin_client().get_admin_token()
+
+async def assign_role_to_user(user_id: str, role_name: str):
+    return await get_keycloak_admin_client().assign_role(user_id, role_name)
+
+async def remove_role_from_user(user_id: str, role_name: str):
+    return await get_keycloak_admin_client().remove_role(user_id, role_name)
@@ -0,0 +1,40 @@
+import os
+import torch
+from fastapi import HTTPException
+from gliner import GLiNER
+
+TORCH_BACKEND = "torch"
+INT8_BACKEND = "int8"
+ONNX_BACKEND = "onnx"
+ONNX_INT8_BACKEND = "onnx-int8"
+BACKENDS = [TORCH_BACKEND, INT8_BACKEND, ONNX_BACKEND, ONNX_INT8_BACKEND]
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+def load_gliner(path: str, backend: str, onnx_dir: str) -> GLiNER:
+    """Load a GLiNER model with the given inference backend.
+
+    "torch" loads full-precision weights from the hub, "int8" additionally applies dynamic int8
+    quantization to the linear layers, and "onnx"/"onnx-int8" load an ONNX Runtime export
+    produced by export_model.py from onnx_dir.
+    """
+    if backend in (TORCH_BACKEND, INT8_BACKEND):
+        model = GLiNER.from_pretrained(path, local_files_only=False)
+        if backend == INT8_BACKEND:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    if backend in (ONNX_BACKEND, ONNX_INT8_BACKEND):
+        onnx_file = ONNX_QUANTIZED_MODEL_FILE if backend == ONNX_INT8_BACKEND else ONNX_MODEL_FILE
+        if not os.path.exists(os.path.join(onnx_dir, onnx_file)):
+            raise HTTPException(status_code=500, detail=f"ONNX export '{onnx_file}' not found in {onnx_dir}, run export_model.py first")
+        return GLiNER.from_pretrained(
+            onnx_dir,
+            load_onnx_model=True,
+            load_tokenizer=True,
+            onnx_model_file=onnx_file,
+            local_files_only=True,
+        )
+
+    raise HTTPException(status_code=500, detail=f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
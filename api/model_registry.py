@@ -0,0 +1,155 @@
+import asyncio
+import gc
+import os
+from collections import OrderedDict
+from typing import Dict, List
+import torch
+from fastapi import HTTPException
+from gliner import GLiNER
+import constants
+from model_backends import TORCH_BACKEND, load_gliner
+
+MODEL_PATHS = {
+    constants.DEFAULT_MODEL_NAME_FRONTEND: constants.DEFAULT_MODEL_NAME,
+    constants.FINETUNED_MODEL_NAME_FRONTEND: constants.FINETUNED_MODEL_NAME,
+}
+
+WARMUP_TEXT = "The patient was prescribed metformin for type 2 diabetes and reported mild nausea after the first dose."
+WARMUP_ENTITY_TYPES = ["Disease", "Drug", "Symptom"]
+PRELOAD_RETRY_SECONDS = 30
+
+def get_model_backend(name: str) -> str:
+    return constants.MODEL_BACKENDS.get(name, TORCH_BACKEND)
+
+def _unique_tensors(models) -> Dict[int, torch.Tensor]:
+    tensors = {}
+    for model in models:
+        if isinstance(model, torch.nn.Module):
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                tensors.setdefault(tensor.untyped_storage().data_ptr(), tensor)
+    return tensors
+
+class ModelRegistry:
+    """Loads each GLiNER model once, warms it up, and tracks whether the preloaded set is ready.
+
+    Resident models are kept in LRU order. When MODEL_MEMORY_BUDGET_MB is set, idle models are
+    evicted once their combined weights exceed it; models with in-flight requests (acquired and
+    not yet released) are never evicted.
+    """
+
+    def __init__(self, memory_budget_mb: float = constants.MODEL_MEMORY_BUDGET_MB):
+        self.models: OrderedDict = OrderedDict()
+        # In-flight loads, so concurrent first requests for a model load it only once
+        self.loading: Dict[str, asyncio.Task] = {}
+        self.refcounts: Dict[str, int] = {name: 0 for name in MODEL_PATHS}
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.ready = False
+
+    def load(self, name: str, resident: List[GLiNER]) -> GLiNER:
+        """Blocking load and warm-up, run on a worker thread. It does not touch self.models, which only
+        the event loop changes; weights are shared with the given snapshot of the resident models."""
+        model = load_gliner(MODEL_PATHS[name], get_model_backend(name), os.path.join(constants.ONNX_MODELS_DIR, name))
+        self._warm_up(model)
+        self._share_weights(model, resident)
+        return model
+
+    def _warm_up(self, model: GLiNER):
+        # A first synthetic inference initializes the tokenizer and CPU kernels before real traffic arrives
+        model.predict_entities(WARMUP_TEXT, WARMUP_ENTITY_TYPES)
+
+    def _share_weights(self, model: GLiNER, resident_models: List[GLiNER]):
+        """Point parameters identical to ones of an already resident model (e.g. a shared backbone) at the same tensor."""
+        if not isinstance(model, torch.nn.Module):
+            return
+        resident = {}
+        for other in resident_models:
+            if isinstance(other, torch.nn.Module):
+                for key, tensor in other.named_parameters():
+                    resident.setdefault(key, tensor)
+
+        shared_bytes = 0
+        for module_name, module in model.named_modules():
+            for param_name, param in list(module._parameters.items()):
+                key = f"{module_name}.{param_name}" if module_name else param_name
+                other = resident.get(key)
+                if (other is not None and param is not None and other is not param
+                        and other.shape == param.shape and other.dtype == param.dtype and torch.equal(other, param)):
+                    module._parameters[param_name] = other
+                    shared_bytes += other.numel() * other.element_size()
+        if shared_bytes:
+            print(f"Shared {shared_bytes / 1024 / 1024:.1f} MB of weights with resident models")
+
+    def memory_bytes(self) -> int:
+        return sum(t.numel() * t.element_size() for t in _unique_tensors(list(self.models.values())).values())
+
+    def _evict_idle(self, keep: str):
+        if self.memory_budget <= 0:
+            return
+        evicted = False
+        for name in list(self.models):
+            if self.memory_bytes() <= self.memory_budget:
+                break
+            if name == keep or self.refcounts[name] > 0:
+                continue
+            del self.models[name]
+            evicted = True
+            print(f"Evicted idle model '{name}' to stay within the memory budget")
+        if evicted:
+            gc.collect()
+
+    async def _load(self, name: str) -> GLiNER:
+        try:
+            model = await asyncio.to_thread(self.load, name, list(self.models.values()))
+            self.models[name] = model
+            self._evict_idle(keep=name)
+            return model
+        finally:
+            del self.loading[name]
+
+    async def get(self, name: str) -> GLiNER:
+        if name not in MODEL_PATHS:
+            raise HTTPException(status_code=400, detail=f"Model '{name}' not available")
+        model = self.models.get(name)
+        if model is None:
+            if name not in self.loading:
+                self.loading[name] = asyncio.create_task(self._load(name))
+            # Shielded so a cancelled request does not cancel a load other requests are waiting for
+            model = await asyncio.shield(self.loading[name])
+        if name in self.models:
+            self.models.move_to_end(name)
+        return model
+
+    async def acquire(self, name: str) -> GLiNER:
+        """Get a model and keep it resident until the matching release()."""
+        model = await self.get(name)
+        self.refcounts[name] += 1
+        return model
+
+    def release(self, name: str):
+        self.refcounts[name] -= 1
+
+    async def preload(self, names: List[str]):
+        """Load and warm up the configured models, retrying until all of them are available.
+        Names that are not local GLiNER models (e.g. the Gemini model) are skipped, since they would never load."""
+        unknown = [name for name in names if name not in MODEL_PATHS]
+        if unknown:
+            print(f"Skipping PRELOAD_MODELS entries that are not local models: {unknown}")
+            names = [name for name in names if name in MODEL_PATHS]
+        while True:
+            try:
+                for name in names:
+                    await self.get(name)
+                self.ready = True
+                print(f"Preloaded models: {names}")
+                return
+            except Exception as e:
+                print(f"Error preloading models, retrying in {PRELOAD_RETRY_SECONDS}s: {e}")
+                await asyncio.sleep(PRELOAD_RETRY_SECONDS)
+
+model_registry = None
+
+def get_model_registry() -> ModelRegistry:
+    global model_registry
+    if model_registry is None:
+        model_registry = ModelRegistry()
+    return model_registry
@@ -0,0 +1,68 @@
+import os
+from typing import Optional
+from pymongo import AsyncMongoClient, ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import OperationFailure
+import constants
+
+EXPERIMENT_RESULTS_COLLECTION_NAME = "ExperimentResults"
+EXPERIMENT_RUN_RESULTS_COLLECTION_NAME = "ExperimentRunResults"
+PREDICTION_CACHE_COLLECTION_NAME = "PredictionCache"
+
+class MongoStore:
+    """One pooled async Mongo client shared by every part of the API that stores documents in Mongo."""
+
+    def __init__(self, url: str, db_name: str, training_collection_name: str):
+        self.client = AsyncMongoClient(
+            url,
+            maxPoolSize=constants.MONGO_MAX_POOL_SIZE,
+            minPoolSize=constants.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=constants.MONGO_MAX_IDLE_SECONDS * 1000,
+            serverSelectionTimeoutMS=constants.MONGO_SERVER_SELECTION_TIMEOUT_SECONDS * 1000,
+        )
+        self.db = self.client[db_name]
+        self.training_collection_name = training_collection_name
+
+    def training_texts(self) -> AsyncCollection:
+        return self.db[self.training_collection_name]
+
+    def experiment_results(self) -> AsyncCollection:
+        """Runs stored before results were split per document, migrated when they are first read."""
+        return self.db[EXPERIMENT_RESULTS_COLLECTION_NAME]
+
+    def run_results(self) -> AsyncCollection:
+        return self.db[EXPERIMENT_RUN_RESULTS_COLLECTION_NAME]
+
+    def prediction_cache(self) -> AsyncCollection:
+        return self.db[PREDICTION_CACHE_COLLECTION_NAME]
+
+    async def ensure_indexes(self):
+        """Create the indexes the API relies on; creating an index that already exists is a no-op."""
+        try:
+            await self.experiment_results().create_index([("experiment_run_id", ASCENDING)], unique=True)
+        except OperationFailure as e:
+            # Older data may hold duplicate result documents for a run; lookups still need the index
+            print(f"Could not create unique experiment_run_id index, creating a non-unique one: {e}")
+            await self.experiment_results().create_index([("experiment_run_id", ASCENDING)])
+
+        await self.run_results().create_index([("experiment_run_id", ASCENDING), ("document_id", ASCENDING)], unique=True)
+        await self.run_results().create_index([("experiment_run_id", ASCENDING), ("labels", ASCENDING), ("document_id", ASCENDING)])
+
+        try:
+            await self.training_texts().create_index([("text_hash", ASCENDING)], unique=True)
+        except OperationFailure as e:
+            print(f"Could not create unique text_hash index for training texts: {e}")
+
+        if constants.PREDICTION_CACHE_MONGO:
+            await self.prediction_cache().create_index("created_at", expireAfterSeconds=int(constants.PREDICTION_CACHE_TTL_SECONDS))
+
+    async def close(self):
+        await self.client.close()
+
+mongo_store: Optional[MongoStore] = None
+
+def get_mongo_store() -> MongoStore:
+    global mongo_store
+    if mongo_store is None:
+        mongo_store = MongoStore(os.getenv("MONGO_URL"), os.getenv("MONGO_DB_NAME"), os.getenv("MONGO_COLLECTION_NAME"))
+    return mongo_store
@@ -0,0 +1,33 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 200
+
+def check_limit(limit: int) -> int:
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+def encode_cursor(*values) -> str:
+    """An opaque cursor holding the sort key of the last row of a page."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor: Optional[str], *types) -> Optional[list]:
+    """Decode a cursor into values of the given types (datetime or int), or None when there is no cursor."""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [datetime.fromisoformat(v) if t is datetime else t(v) for t, v in zip(types, payload, strict=True)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def next_cursor(rows: list, limit: int, key) -> Optional[str]:
+    """Cursor for the page after rows, which were fetched with limit + 1 to detect whether one exists."""
+    if len(rows) <= limit:
+        return None
+    return encode_cursor(*key(rows[limit - 1]))
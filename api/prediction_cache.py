@@ -0,0 +1,104 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+import constants
+from helpers import get_text_hash
+from mongo import get_mongo_store
+
+class TTLCache:
+    """In-memory LRU cache whose entries also expire after ttl_seconds."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class PredictionCache:
+    """Caches entity predictions in an LRU memory tier with an optional shared Mongo tier."""
+
+    def __init__(self, max_size: int = constants.PREDICTION_CACHE_SIZE, ttl_seconds: float = constants.PREDICTION_CACHE_TTL_SECONDS, use_mongo: bool = constants.PREDICTION_CACHE_MONGO):
+        self.memory = TTLCache(max_size, ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.use_mongo = use_mongo
+        self.hits = 0
+        self.misses = 0
+        self.mongo_hits = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str, entity_types: List[str], threshold: float, multi_label: bool) -> str:
+        # The text is hashed exactly as given, since entity offsets depend on every character
+        labels = ",".join(sorted(entity_types))
+        return f"{model_name}|{get_text_hash(text)}|{labels}|{threshold}|{int(bool(multi_label))}"
+
+    async def get(self, key: str) -> Optional[list]:
+        entities = self.memory.get(key)
+        if entities is None and self.use_mongo:
+            try:
+                document = await get_mongo_store().prediction_cache().find_one({"_id": key})
+            except Exception as e:
+                print(f"Prediction cache lookup failed: {e}")
+                document = None
+            if document is not None:
+                entities = document["entities"]
+                self.memory.set(key, entities)
+                self.mongo_hits += 1
+
+        if entities is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entities
+
+    async def set(self, key: str, entities: list):
+        # Empty results are not cached, since failed predictions are also reported as empty lists
+        if not entities:
+            return
+        self.memory.set(key, entities)
+        if self.use_mongo:
+            try:
+                await get_mongo_store().prediction_cache().replace_one(
+                    {"_id": key},
+                    {"_id": key, "entities": entities, "created_at": datetime.utcnow()},
+                    upsert=True,
+                )
+            except Exception as e:
+                print(f"Prediction cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "mongo_hits": self.mongo_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+prediction_cache = None
+
+def get_prediction_cache() -> PredictionCache:
+    global prediction_cache
+    if prediction_cache is None:
+        prediction_cache = PredictionCache()
+    return prediction_cache
@@ -0,0 +1,134 @@
+from typing import List, Optional
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, ReplaceOne
+import constants
+from mongo import get_mongo_store
+
+# Entity columns in the order they are laid out in a record's payload, followed by the UTF-8 entity texts
+ENTITY_COLUMNS = [("start", "<i4"), ("end", "<i4"), ("text_length", "<i4"), ("label_id", "<u2"), ("score", "<f2")]
+
+def encode_predictions(predictions: list) -> dict:
+    """Encode a document's entities column by column: label dictionary ids, int32 offsets and float16 scores."""
+    labels = list(dict.fromkeys(entity["label"] for entity in predictions))
+    label_ids = {label: i for i, label in enumerate(labels)}
+    texts = [entity.get("text", "").encode("utf-8") for entity in predictions]
+    columns = {
+        "start": [entity["start"] for entity in predictions],
+        "end": [entity["end"] for entity in predictions],
+        "text_length": [len(text) for text in texts],
+        "label_id": [label_ids[entity["label"]] for entity in predictions],
+        "score": [entity["score"] for entity in predictions],
+    }
+    payload = b"".join(np.asarray(columns[name], dtype=dtype).tobytes() for name, dtype in ENTITY_COLUMNS) + b"".join(texts)
+
+    compression = None
+    if constants.RESULTS_COMPRESSION == "zstd" and len(payload) >= constants.RESULTS_COMPRESSION_MIN_BYTES:
+        import zstandard
+        payload = zstandard.ZstdCompressor(level=constants.RESULTS_ZSTD_LEVEL).compress(payload)
+        compression = "zstd"
+    return {"labels": labels, "entity_count": len(predictions), "entities": Binary(payload), "compression": compression}
+
+def decode_columns(record: dict):
+    """The entity columns of a stored record as NumPy arrays, plus the UTF-8 entity texts as one bytes object
+    and the byte offsets where each text starts and ends."""
+    count = record["entity_count"]
+    payload = bytes(record["entities"])
+    if record.get("compression") == "zstd":
+        import zstandard
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+
+    columns = {}
+    offset = 0
+    for name, dtype in ENTITY_COLUMNS:
+        columns[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += count * np.dtype(dtype).itemsize
+    text_offsets = np.concatenate(([0], np.cumsum(columns["text_length"], dtype=np.int64)))
+    return columns, payload[offset:], text_offsets
+
+def decode_predictions(record: dict, label: Optional[str] = None) -> list:
+    """Entities of a stored record, optionally only those with the given label."""
+    count = record["entity_count"]
+    if not count or (label is not None and label not in record["labels"]):
+        return []
+    columns, texts, text_offsets = decode_columns(record)
+    text_offsets = text_offsets.tolist()
+
+    rows = range(count)
+    if label is not None:
+        rows = np.flatnonzero(columns["label_id"] == record["labels"].index(label)).tolist()
+    starts, ends, label_ids = columns["start"].tolist(), columns["end"].tolist(), columns["label_id"].tolist()
+    scores = columns["score"].astype(np.float32).tolist()
+    return [
+        {
+            "start": starts[i],
+            "end": ends[i],
+            "text": texts[text_offsets[i]:text_offsets[i + 1]].decode("utf-8"),
+            "label": record["labels"][label_ids[i]],
+            "score": round(scores[i], 4),
+        }
+        for i in rows
+    ]
+
+def encode_result(run_id: int, result: dict) -> dict:
+    return {
+        "experiment_run_id": run_id,
+        "document_id": result["document_id"],
+        "document_title": result["document_title"],
+        "text_hash": result.get("text_hash"),
+        **encode_predictions(result["predictions"] or []),
+    }
+
+def decode_result(record: dict, label: Optional[str] = None) -> dict:
+    return {
+        "predictions": decode_predictions(record, label),
+        "document_id": record["document_id"],
+        "document_title": record["document_title"],
+        "text_hash": record.get("text_hash"),
+    }
+
+async def store_results(run_id: int, results: List[dict]):
+    """Store a run's results as one record per document."""
+    if results:
+        await get_mongo_store().run_results().insert_many([encode_result(run_id, result) for result in results])
+
+async def delete_results_after(run_id: int, document_id: int):
+    await get_mongo_store().run_results().delete_many({"experiment_run_id": run_id, "document_id": {"$gt": document_id}})
+
+async def fetch_results(run_id: int, limit: Optional[int] = None, after_document_id: Optional[int] = None,
+                        document_id: Optional[int] = None, label: Optional[str] = None) -> List[dict]:
+    """A run's results ordered by document id; with a label, only documents and entities with that label."""
+    query = {"experiment_run_id": run_id}
+    if document_id is not None:
+        query["document_id"] = document_id
+    elif after_document_id is not None:
+        query["document_id"] = {"$gt": after_document_id}
+    if label is not None:
+        query["labels"] = label
+    cursor = get_mongo_store().run_results().find(query, {"_id": 0}).sort("document_id", ASCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return [decode_result(record, label) async for record in cursor]
+
+def fetch_result_records(run_ids: List[int]):
+    """Raw stored records of several runs, for callers that only decode some of them."""
+    return get_mongo_store().run_results().find(
+        {"experiment_run_id": {"$in": run_ids}},
+        {"_id": 0, "experiment_run_id": 1, "document_id": 1, "text_hash": 1, "labels": 1, "entity_count": 1, "entities": 1, "compression": 1}
+    )
+
+async def count_results(run_id: int) -> int:
+    return await get_mongo_store().run_results().count_documents({"experiment_run_id": run_id})
+
+async def migrate_legacy_results(run_ids: List[int]):
+    """Move runs stored as a single ExperimentResults document into per-document records."""
+    store = get_mongo_store()
+    async for legacy in store.experiment_results().find({"experiment_run_id": {"$in": run_ids}}):
+        run_id = legacy["experiment_run_id"]
+        records = [encode_result(run_id, result) for result in legacy.get("results", [])]
+        if records:
+            await store.run_results().bulk_write([
+                ReplaceOne({"experiment_run_id": run_id, "document_id": record["document_id"]}, record, upsert=True)
+                for record in records
+            ])
+        await store.experiment_results().delete_one({"_id": legacy["_id"]})
@@ -0,0 +1,253 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from itertools import combinations
+from typing import List, Optional
+import asyncio
+import numpy as np
+import constants
+from database import get_session
+from experiment_runs import ExperimentRun
+from prediction_cache import TTLCache
+from result_store import count_results, decode_columns, fetch_result_records, migrate_legacy_results
+from utils import premium_user_required
+
+router = APIRouter()
+
+class RunColumns:
+    """Every entity of a run as parallel NumPy arrays, with labels as ids into the run's label list."""
+
+    def __init__(self, run_id: int, documents: np.ndarray, labels: List[str], document: np.ndarray,
+                 start: np.ndarray, end: np.ndarray, label: np.ndarray, score: np.ndarray):
+        self.run_id = run_id
+        self.documents = documents
+        self.labels = labels
+        self.document = document
+        self.start = start
+        self.end = end
+        self.label = label
+        self.score = score
+        self.summary: Optional[dict] = None
+
+async def load_run_columns(run_id: int) -> RunColumns:
+    await migrate_legacy_results([run_id])
+    label_index = {}
+    documents, document, start, end, label, score = [], [], [], [], [], []
+    async for record in fetch_result_records([run_id]):
+        documents.append(record["document_id"])
+        if not record["entity_count"]:
+            continue
+        columns, _, _ = decode_columns(record)
+        label_ids = np.array([label_index.setdefault(name, len(label_index)) for name in record["labels"]], dtype=np.int64)
+        document.append(np.full(record["entity_count"], record["document_id"], dtype=np.int64))
+        start.append(columns["start"].astype(np.int64))
+        end.append(columns["end"].astype(np.int64))
+        label.append(label_ids[columns["label_id"]])
+        score.append(columns["score"].astype(np.float32))
+
+    def concatenate(arrays: list, dtype) -> np.ndarray:
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+    return RunColumns(
+        run_id, np.array(documents, dtype=np.int64), list(label_index),
+        concatenate(document, np.int64), concatenate(start, np.int64), concatenate(end, np.int64),
+        concatenate(label, np.int64), concatenate(score, np.float32),
+    )
+
+def summarize_run(run: RunColumns) -> dict:
+    """Entity and document counts, mean score and score histogram per label."""
+    bins = constants.ANALYTICS_SCORE_BINS
+    num_labels = len(run.labels)
+    entities = np.bincount(run.label, minlength=num_labels)
+    score_sums = np.bincount(run.label, weights=run.score, minlength=num_labels)
+    score_bins = np.clip((run.score * bins).astype(np.int64), 0, bins - 1)
+    histograms = np.bincount(run.label * bins + score_bins, minlength=num_labels * bins).reshape(num_labels, bins)
+    documents = np.bincount(np.unique(run.document * num_labels + run.label) % max(num_labels, 1), minlength=num_labels)
+
+    labels = [
+        {
+            "label": name,
+            "entities": int(entities[i]),
+            "documents": int(documents[i]),
+            "mean_score": round(float(score_sums[i] / entities[i]), 4) if entities[i] else None,
+            "score_histogram": histograms[i].tolist(),
+        }
+        for i, name in enumerate(run.labels)
+    ]
+    return {
+        "run_id": run.run_id,
+        "documents": len(run.documents),
+        "documents_with_entities": len(np.unique(run.document)),
+        "entities": len(run.label),
+        "score_bins": np.linspace(0, 1, bins + 1).round(4).tolist(),
+        "labels": sorted(labels, key=lambda item: item["entities"], reverse=True),
+    }
+
+def overlap_mask(x: dict, y: dict, num_labels: int, span_limit: int) -> np.ndarray:
+    """For each entity of x, whether y has an entity with the same label in the same document overlapping it."""
+    if not len(y["start"]):
+        return np.zeros(len(x["start"]), dtype=bool)
+    y_group = y["document"] * num_labels + y["label"]
+    order = np.argsort(y_group * span_limit + y["start"], kind="stable")
+    y_group, y_key = y_group[order], (y_group * span_limit + y["start"])[order]
+    # Running maximum of end within each group; offsetting by the group rank keeps groups from leaking into each other
+    group_rank = np.concatenate(([0], np.cumsum(y_group[1:] != y_group[:-1])))
+    max_end = np.maximum.accumulate(y["end"][order] + group_rank * span_limit) - group_rank * span_limit
+
+    x_group = x["document"] * num_labels + x["label"]
+    # Last entity of y in the same group that starts before x ends
+    candidate = np.searchsorted(y_key, x_group * span_limit + x["end"], side="left") - 1
+    found = candidate >= 0
+    candidate = np.maximum(candidate, 0)
+    return found & (y_group[candidate] == x_group) & (max_end[candidate] > x["start"])
+
+def sorted_unique_rows(rows: np.ndarray):
+    """Rows sorted lexicographically, and a mask of the rows equal to the row before them."""
+    rows = rows[np.lexsort(rows.T[::-1])]
+    repeated = np.zeros(len(rows), dtype=bool)
+    repeated[1:] = (rows[1:] == rows[:-1]).all(axis=1)
+    return rows, repeated
+
+def agreement_scores(matched_first: np.ndarray, matched_second: np.ndarray, first_total: np.ndarray, second_total: np.ndarray) -> dict:
+    """Precision of the second run and recall of the first, treating the first run as the reference."""
+    precision = np.divide(matched_second, second_total, out=np.zeros(len(second_total)), where=second_total > 0)
+    recall = np.divide(matched_first, first_total, out=np.zeros(len(first_total)), where=first_total > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(precision)), where=precision + recall > 0)
+    return {"precision": precision.round(4).tolist(), "recall": recall.round(4).tolist(), "f1": f1.round(4).tolist()}
+
+def compare_pair(first: RunColumns, second: RunColumns) -> dict:
+    """Exact and overlapping span agreement between two runs over the documents both of them cover."""
+    labels = sorted(set(first.labels) | set(second.labels))
+    label_index = {name: i for i, name in enumerate(labels)}
+    common_documents = np.intersect1d(first.documents, second.documents)
+
+    num_labels = max(len(labels), 1)
+    span_limit = int(max(first.end.max(initial=0), second.end.max(initial=0))) + 1
+    # Spans are packed into single int64 keys when they fit, which sorts far faster than rows of four columns
+    packed = len(common_documents) * num_labels * span_limit * span_limit < 2 ** 63
+
+    def shared_spans(run: RunColumns) -> dict:
+        """The run's distinct spans in the common documents, with documents as indexes into common_documents."""
+        in_common = np.isin(run.document, common_documents)
+        document = np.searchsorted(common_documents, run.document[in_common])
+        label = np.array([label_index[name] for name in run.labels], dtype=np.int64)[run.label[in_common]]
+        start, end = run.start[in_common], run.end[in_common]
+        if packed:
+            keys = np.sort(((document * num_labels + label) * span_limit + start) * span_limit + end)
+            distinct = np.ones(len(keys), dtype=bool)
+            distinct[1:] = keys[1:] != keys[:-1]
+            keys = keys[distinct]
+            rest, end = np.divmod(keys, span_limit)
+            rest, start = np.divmod(rest, span_limit)
+            document, label = np.divmod(rest, num_labels)
+        else:
+            keys, repeated = sorted_unique_rows(np.stack([document, label, start, end], axis=1))
+            keys = keys[~repeated]
+            document, label, start, end = keys.T
+        return {"document": document, "start": start, "end": end, "label": label, "keys": keys}
+
+    x, y = shared_spans(first), shared_spans(second)
+    first_total = np.bincount(x["label"], minlength=num_labels)
+    second_total = np.bincount(y["label"], minlength=num_labels)
+
+    if packed:
+        exact = np.bincount(x["label"][np.isin(x["keys"], y["keys"], assume_unique=True, kind="sort")], minlength=num_labels)
+    else:
+        # Spans are distinct within each run, so a span repeated in the union is in both runs
+        union, repeated = sorted_unique_rows(np.concatenate([x["keys"], y["keys"]]))
+        exact = np.bincount(union[repeated, 1], minlength=num_labels)
+
+    overlap_first = np.bincount(x["label"][overlap_mask(x, y, num_labels, span_limit)], minlength=num_labels)
+    overlap_second = np.bincount(y["label"][overlap_mask(y, x, num_labels, span_limit)], minlength=num_labels)
+
+    exact_count, overlap_first_count, overlap_second_count, first_count, second_count = (
+        np.atleast_1d(values.sum()) for values in (exact, overlap_first, overlap_second, first_total, second_total)
+    )
+    exact_total = agreement_scores(exact_count, exact_count, first_count, second_count)
+    overlap_total = agreement_scores(overlap_first_count, overlap_second_count, first_count, second_count)
+    exact_by_label = agreement_scores(exact, exact, first_total, second_total)
+    overlap_by_label = agreement_scores(overlap_first, overlap_second, first_total, second_total)
+    return {
+        "run_ids": [first.run_id, second.run_id],
+        "common_documents": len(common_documents),
+        "first_entities": int(first_total.sum()),
+        "second_entities": int(second_total.sum()),
+        "exact_matches": int(exact.sum()),
+        "only_in_first": int(first_total.sum() - exact.sum()),
+        "only_in_second": int(second_total.sum() - exact.sum()),
+        "exact": {key: values[0] for key, values in exact_total.items()},
+        "overlap": {key: values[0] for key, values in overlap_total.items()},
+        "labels": [
+            {
+                "label": name,
+                "first_entities": int(first_total[i]),
+                "second_entities": int(second_total[i]),
+                "exact_matches": int(exact[i]),
+                "exact": {key: values[i] for key, values in exact_by_label.items()},
+                "overlap": {key: values[i] for key, values in overlap_by_label.items()},
+            }
+            for i, name in enumerate(labels)
+        ],
+    }
+
+class RunAnalytics:
+    """Keeps the decoded columns and summary of recently analysed runs, reloading a run once its stored
+    results change (as they do while a run is still in progress)."""
+
+    def __init__(self, max_runs: int = constants.ANALYTICS_CACHE_SIZE, ttl_seconds: float = constants.ANALYTICS_CACHE_TTL_SECONDS):
+        self.runs = TTLCache(max_runs, ttl_seconds)
+
+    async def columns(self, run_id: int) -> RunColumns:
+        run = self.runs.get(run_id)
+        if run is None or len(run.documents) != await count_results(run_id):
+            run = await load_run_columns(run_id)
+            self.runs.set(run_id, run)
+        return run
+
+    async def summary(self, run_id: int) -> dict:
+        run = await self.columns(run_id)
+        if run.summary is None:
+            run.summary = await asyncio.to_thread(summarize_run, run)
+        return run.summary
+
+    async def compare(self, run_ids: List[int]) -> list:
+        runs = [await self.columns(run_id) for run_id in run_ids]
+        return await asyncio.to_thread(lambda: [compare_pair(first, second) for first, second in combinations(runs, 2)])
+
+run_analytics = None
+
+def get_run_analytics() -> RunAnalytics:
+    global run_analytics
+    if run_analytics is None:
+        run_analytics = RunAnalytics()
+    return run_analytics
+
+@router.get("/experiment-runs/{run_id}/summary")
+async def get_run_summary(run_id: int, request: Request, user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """Per-label entity counts, document counts, mean scores and score histograms of a run."""
+    if not await session.get(ExperimentRun, run_id):
+        raise HTTPException(status_code=404, detail="Experiment run not found")
+    await session.commit()
+    return await get_run_analytics().summary(run_id)
+
+@router.get("/experiments/{experiment_id}/runs/compare")
+async def compare_runs(experiment_id: int, request: Request, run_ids: List[int] = Query(...),
+                       user=Depends(premium_user_required), session: AsyncSession = Depends(get_session)):
+    """Summaries of two or more runs of an experiment and pairwise agreement between them: exact span matches,
+    overlapping spans with the same label, and precision, recall and F1 taking the earlier-listed run as reference."""
+    run_ids = list(dict.fromkeys(run_ids))
+    if not 2 <= len(run_ids) <= constants.ANALYTICS_MAX_COMPARE_RUNS:
+        raise HTTPException(status_code=400, detail=f"Compare between 2 and {constants.ANALYTICS_MAX_COMPARE_RUNS} runs")
+    found = set(await session.scalars(
+        select(ExperimentRun.id).where(ExperimentRun.experiment_id == experiment_id, ExperimentRun.id.in_(run_ids))
+    ))
+    await session.commit()
+    if len(found) != len(run_ids):
+        raise HTTPException(status_code=404, detail="Experiment runs not found for this experiment")
+
+    analytics = get_run_analytics()
+    return {
+        "experiment_id": experiment_id,
+        "runs": [await analytics.summary(run_id) for run_id in run_ids],
+        "pairs": await analytics.compare(run_ids),
+    }
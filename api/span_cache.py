@@ -0,0 +1,82 @@
+import copy
+import weakref
+from typing import List, Optional
+import numpy as np
+from gliner import GLiNER
+import constants
+from helpers import get_text_hash, run_sorted_batches
+from prediction_cache import TTLCache
+
+# GLiNER decoding is "keep every span scoring above the threshold, then greedily drop overlaps".
+# Caching every span above a low floor therefore lets any threshold at or above the floor, with or
+# without multi-labeling, be answered by re-running only the decoding step below.
+
+def _keep_all_spans(spans, flat_ner=True, multi_label=False):
+    return list(spans)
+
+candidate_models = weakref.WeakKeyDictionary()
+def get_candidate_model(model: GLiNER) -> Optional[GLiNER]:
+    """A shallow copy of the model sharing its weights, whose decoder skips overlap removal."""
+    decoder = getattr(model, "decoder", None)
+    if decoder is None or not hasattr(decoder, "greedy_search"):
+        return None
+    if model not in candidate_models:
+        candidate_decoder = copy.copy(decoder)
+        candidate_decoder.greedy_search = _keep_all_spans
+        candidate_model = copy.copy(model)
+        candidate_model.decoder = candidate_decoder
+        candidate_models[model] = candidate_model
+    return candidate_models[model]
+
+def supports_span_cache(model: GLiNER, threshold: Optional[float]) -> bool:
+    return threshold is not None and threshold >= constants.SPAN_SCORE_FLOOR and get_candidate_model(model) is not None
+
+def _overlaps(a: dict, b: dict, multi_label: bool) -> bool:
+    if a["start"] == b["start"] and a["end"] == b["end"]:
+        return not multi_label
+    return not (a["start"] >= b["end"] or b["start"] >= a["end"])
+
+def greedy_decode(spans: List[dict], multi_label: bool) -> List[dict]:
+    """GLiNER's flat greedy decoding: keep the highest scoring spans that do not overlap, ordered by start."""
+    selected = []
+    for span in sorted(spans, key=lambda c: -c["score"]):
+        if not any(_overlaps(span, other, multi_label) for other in selected):
+            selected.append(span)
+    selected.sort(key=lambda c: c["start"])
+    return [dict(span) for span in selected]
+
+def decode_candidates(candidates: List[dict], threshold: float, multi_label: bool) -> List[dict]:
+    """Apply GLiNER's threshold and flat greedy decoding to cached candidate spans."""
+    # GLiNER compares float32 probabilities against the threshold, so compare at the same precision
+    threshold = float(np.float32(threshold))
+    return greedy_decode([c for c in candidates if c["score"] > threshold], multi_label)
+
+span_score_cache = None
+def get_span_score_cache() -> TTLCache:
+    global span_score_cache
+    if span_score_cache is None:
+        span_score_cache = TTLCache(constants.SPAN_CACHE_SIZE, constants.SPAN_CACHE_TTL_SECONDS)
+    return span_score_cache
+
+async def predict_with_span_cache(model_name: str, model: GLiNER, entity_types: List[str], texts: list, threshold: float, multi_label: bool) -> list:
+    cache = get_span_score_cache()
+    labels = ",".join(sorted(entity_types))
+    keys = [f"{model_name}|{get_text_hash(text)}|{labels}" for text in texts]
+    candidates = [cache.get(key) for key in keys]
+
+    missing = [i for i, spans in enumerate(candidates) if spans is None]
+    if missing:
+        extracted = await run_sorted_batches(
+            model_name,
+            get_candidate_model(model),
+            [texts[i] for i in missing],
+            entity_types,
+            constants.SPAN_SCORE_FLOOR,
+            True,
+        )
+        for i, spans in zip(missing, extracted):
+            candidates[i] = spans
+            if spans is not None:
+                cache.set(keys[i], spans)
+
+    return [decode_candidates(spans, threshold, multi_label) if spans is not None else [] for spans in candidates]
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, Text
-from experiments import SessionLocal, Base
+from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, Text, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Base, engine, AsyncSessionLocal, get_session
 from utils import premium_user_required, get_user_from_token
 from stripe_service import StripeService
 from datetime import datetime, timedelta
@@ -21,24 +22,22 @@ class Subscription(Base):
     created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
     updated_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-Base.metadata.create_all(bind=SessionLocal.kw['bind'])
+Base.metadata.create_all(bind=engine)
 
 router = APIRouter()
 
 @router.post("/create-checkout-session")
-async def create_checkout_session(request: Request):
+async def create_checkout_session(request: Request, session: AsyncSession = Depends(get_session)):
     """Create a Stripe checkout session for premium subscription."""
     try:
         user_details = get_user_from_token(request)
         user_id = user_details["id"]
         user_email = user_details["email"]
         
-        session = SessionLocal()
-        existing_subscription = session.query(Subscription).filter(
+        existing_subscription = await session.scalar(select(Subscription).where(
             Subscription.user_id == user_id,
             Subscription.status == "active"
-        ).first()
-        session.close()
+        ))
         
         if existing_subscription:
             raise HTTPException(
@@ -80,17 +79,15 @@ async def get_checkout_session(session_id: str, request: Request):
         raise HTTPException(status_code=500, detail=f"Failed to retrieve checkout session: {str(e)}")
 
 @router.get("/subscription-status")
-async def get_subscription_status(request: Request):
+async def get_subscription_status(request: Request, session: AsyncSession = Depends(get_session)):
     """Get user's subscription status."""
     try:
         user_details = get_user_from_token(request)
         user_id = user_details["id"]
         
-        session = SessionLocal()
-        subscription = session.query(Subscription).filter(
+        subscription = await session.scalar(select(Subscription).where(
             Subscription.user_id == user_id
-        ).first()
-        session.close()
+        ))
         
         if not subscription:
             return {
@@ -112,18 +109,16 @@ async def get_subscription_status(request: Request):
         raise HTTPException(status_code=500, detail=f"Failed to get subscription status: {str(e)}")
 
 @router.post("/create-portal-session")
-async def create_portal_session(request: Request):
+async def create_portal_session(request: Request, session: AsyncSession = Depends(get_session)):
     """Create a customer portal session for subscription management."""
     try:
         user_details = get_user_from_token(request)
         user_id = user_details["id"]
         
-        session = SessionLocal()
-        subscription = session.query(Subscription).filter(
+        subscription = await session.scalar(select(Subscription).where(
             Subscription.user_id == user_id,
             Subscription.stripe_customer_id.isnot(None)
-        ).first()
-        session.close()
+        ))
         
         if not subscription:
             raise HTTPException(
@@ -187,43 +182,41 @@ async def handle_checkout_session_completed(session_data):
         import stripe
         subscription = stripe.Subscription.retrieve(subscription_id)
 
-        db_session = SessionLocal()
-        try:
-            existing_subscription = db_session.query(Subscription).filter(
-                Subscription.user_id == user_id
-            ).first()
+        async with AsyncSessionLocal() as db_session:
+            try:
+                existing_subscription = await db_session.scalar(select(Subscription).where(
+                    Subscription.user_id == user_id
+                ))
             
-            if existing_subscription:
-                existing_subscription.stripe_customer_id = session_data["customer"]
-                existing_subscription.stripe_subscription_id = subscription_id
-                existing_subscription.status = subscription.get('status', 'unknown')
-                existing_subscription.current_period_start = datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_start"])
-                existing_subscription.current_period_end = datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_end"])
-                existing_subscription.updated_at = datetime.utcnow()
-            else:
-                new_subscription = Subscription(
-                    user_id=user_id,
-                    stripe_customer_id=session_data["customer"],
-                    stripe_subscription_id=subscription_id,
-                    status=subscription.get('status', 'unknown'),
-                    current_period_start=datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_start"]),
-                    current_period_end=datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_end"])
-                )
-                db_session.add(new_subscription)
+                if existing_subscription:
+                    existing_subscription.stripe_customer_id = session_data["customer"]
+                    existing_subscription.stripe_subscription_id = subscription_id
+                    existing_subscription.status = subscription.get('status', 'unknown')
+                    existing_subscription.current_period_start = datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_start"])
+                    existing_subscription.current_period_end = datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_end"])
+                    existing_subscription.updated_at = datetime.utcnow()
+                else:
+                    new_subscription = Subscription(
+                        user_id=user_id,
+                        stripe_customer_id=session_data["customer"],
+                        stripe_subscription_id=subscription_id,
+                        status=subscription.get('status', 'unknown'),
+                        current_period_start=datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_start"]),
+                        current_period_end=datetime.fromtimestamp(subscription["items"]["data"][-1]["current_period_end"])
+                    )
+                    db_session.add(new_subscription)
             
-            db_session.commit()
-            print(f"Subscription record created/updated for user {user_id}")
+                await db_session.commit()
+                print(f"Subscription record created/updated for user {user_id}")
             
-        except Exception as db_error:
-            db_session.rollback()
-            print(f"Database error: {db_error}")
-            raise
-        finally:
-            db_session.close()
+            except Exception as db_error:
+                await db_session.rollback()
+                print(f"Database error: {db_error}")
+                raise
         
         try:
             from utils import assign_role_to_user
-            result = assign_role_to_user(user_id, "premium_user")
+            result = await assign_role_to_user(user_id, "premium_user")
             print(f"Role assignment result: {result}")
         except Exception as role_error:
             print(f"Role assignment error: {role_error}")
@@ -239,19 +232,17 @@ async def handle_subscription_updated(subscription_data):
         print("Updating subscription.")
         subscription_id = subscription_data["id"]
         
-        db_session = SessionLocal()
-        subscription = db_session.query(Subscription).filter(
-            Subscription.stripe_subscription_id == subscription_id
-        ).first()
-        
-        if subscription:
-            subscription.status = subscription_data["status"]
-            subscription.current_period_start = datetime.fromtimestamp(subscription_data["items"]["data"][-1]["current_period_start"])
-            subscription.current_period_end = datetime.fromtimestamp(subscription_data["items"]["data"][-1]["current_period_end"])
-            subscription.updated_at = datetime.utcnow()
-            db_session.commit()
+        async with AsyncSessionLocal() as db_session:
+            subscription = await db_session.scalar(select(Subscription).where(
+                Subscription.stripe_subscription_id == subscription_id
+            ))
         
-        db_session.close()
+            if subscription:
+                subscription.status = subscription_data["status"]
+                subscription.current_period_start = datetime.fromtimestamp(subscription_data["items"]["data"][-1]["current_period_start"])
+                subscription.current_period_end = datetime.fromtimestamp(subscription_data["items"]["data"][-1]["current_period_end"])
+                subscription.updated_at = datetime.utcnow()
+                await db_session.commit()
         
     except Exception as e:
         print(f"Error handling subscription updated: {e}")
@@ -262,21 +253,19 @@ async def handle_subscription_deleted(subscription_data):
         print("Deleting subscription.")
         subscription_id = subscription_data["id"]
         
-        db_session = SessionLocal()
-        subscription = db_session.query(Subscription).filter(
-            Subscription.stripe_subscription_id == subscription_id
-        ).first()
+        async with AsyncSessionLocal() as db_session:
+            subscription = await db_session.scalar(select(Subscription).where(
+                Subscription.stripe_subscription_id == subscription_id
+            ))
         
-        if subscription:
-            subscription.status = "canceled"
-            subscription.updated_at = datetime.utcnow()
-            db_session.commit()
+            if subscription:
+                subscription.status = "canceled"
+                subscription.updated_at = datetime.utcnow()
+                await db_session.commit()
             
-            from utils import remove_role_from_user
-            remove_role_from_user(subscription.user_id, "premium_user")
-            print(f"Premium role removed from user {subscription.user_id}")
-        
-        db_session.close()
+                from utils import remove_role_from_user
+                await remove_role_from_user(subscription.user_id, "premium_user")
+                print(f"Premium role removed from user {subscription.user_id}")
         
     except Exception as e:
         print(f"Error handling subscription deleted: {e}")
@@ -287,17 +276,15 @@ async def handle_payment_succeeded(invoice_data):
         print("Payment succeeded.")
         subscription_id = invoice_data["parent"]["subscription_details"]["subscription"]
         
-        db_session = SessionLocal()
-        subscription = db_session.query(Subscription).filter(
-            Subscription.stripe_subscription_id == subscription_id
-        ).first()
+        async with AsyncSessionLocal() as db_session:
+            subscription = await db_session.scalar(select(Subscription).where(
+                Subscription.stripe_subscription_id == subscription_id
+            ))
         
-        if subscription:
-            subscription.status = "active"
-            subscription.updated_at = datetime.utcnow()
-            db_session.commit()
-        
-        db_session.close()
+            if subscription:
+                subscription.status = "active"
+                subscription.updated_at = datetime.utcnow()
+                await db_session.commit()
         
     except Exception as e:
         print(f"Error handling payment succeeded: {e}")
@@ -307,17 +294,15 @@ async def handle_payment_failed(invoice_data):
     try:
         subscription_id = invoice_data["subscription"]
         
-        db_session = SessionLocal()
-        subscription = db_session.query(Subscription).filter(
-            Subscription.stripe_subscription_id == subscription_id
-        ).first()
-        
-        if subscription:
-            subscription.status = "past_due"
-            subscription.updated_at = datetime.utcnow()
-            db_session.commit()
+        async with AsyncSessionLocal() as db_session:
+            subscription = await db_session.scalar(select(Subscription).where(
+                Subscription.stripe_subscription_id == subscription_id
+            ))
         
-        db_session.close()
+            if subscription:
+                subscription.status = "past_due"
+                subscription.updated_at = datetime.utcnow()
+                await db_session.commit()
         
     except Exception as e:
         print(f"Error handling payment failed: {e}")
@@ -0,0 +1,57 @@
+"""The API modules import each other as top-level modules, so the tests run with api/ on the path.
+
+database, experiment_runs and daily_usage create their tables when imported, so they are replaced
+by stand-ins declaring the same names without a Postgres connection. Tests replace the functions
+they exercise.
+"""
+import os
+import sys
+import types
+from sqlalchemy import Column, Integer, create_mock_engine
+from sqlalchemy.orm import declarative_base
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def requires_postgres(*args, **kwargs):
+    raise RuntimeError("Postgres is not available in unit tests")
+
+async def get_session():
+    requires_postgres()
+
+def stand_in(name: str, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+Base = declarative_base()
+
+class ExperimentRun(Base):
+    __tablename__ = "experiment_runs"
+    __table_args__ = {"schema": "experiments"}
+    id = Column(Integer, primary_key=True)
+
+stand_in(
+    "database",
+    Base=Base,
+    # Accepts the DDL modules run at import without executing it
+    engine=create_mock_engine("postgresql+asyncpg://", lambda *args, **kwargs: None),
+    ensure_indexes=lambda table: None,
+    ensure_columns=lambda table: None,
+    AsyncSessionLocal=requires_postgres,
+    get_session=get_session,
+)
+stand_in(
+    "experiment_runs",
+    ExperimentRun=ExperimentRun,
+    prepare_run=requires_postgres,
+    run_document_batches=requires_postgres,
+    find_previous_predictions=requires_postgres,
+)
+stand_in(
+    "daily_usage",
+    get_user_usage=requires_postgres,
+    add_usage_deltas=requires_postgres,
+    reserve_user_usage=requires_postgres,
+    refund_user_usage=requires_postgres,
+)
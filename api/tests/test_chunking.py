@@ -0,0 +1,97 @@
+import asyncio
+import random
+import re
+import pytest
+
+pytest.importorskip("gliner")
+
+from chunking import merge_window_entities, predict_windowed, split_into_windows
+
+TERMS = {"heart failure": "disease", "metformin": "drug", "chest pain": "symptom", "aspirin": "drug"}
+FILLER = ["The patient", "was seen", "in clinic", "today", "and reported", "no other", "complaints", "overall"]
+
+def clinical_text(seed: int, sentences: int) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(sentences):
+        words = rng.sample(FILLER, 4) + [rng.choice(list(TERMS))]
+        rng.shuffle(words)
+        parts.append(" ".join(words) + rng.choice([".", "!", "?", ";"]))
+    return rng.choice([" ", "\n"]).join(parts)
+
+async def find_terms(texts: list) -> list:
+    """A stand-in model: every occurrence of a known term, scored by its position so scores differ."""
+    results = []
+    for text in texts:
+        results.append([
+            {"start": m.start(), "end": m.end(), "text": m.group(), "label": TERMS[m.group()], "score": 0.5 + m.start() / (2 * len(text) + 2)}
+            for m in re.finditer("|".join(TERMS), text)
+        ])
+    return results
+
+def test_short_text_is_one_window():
+    assert split_into_windows("Aspirin daily.", window_chars=100, overlap_chars=20) == [(0, "Aspirin daily.")]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_windows_are_slices_covering_the_text(seed):
+    text = clinical_text(seed, sentences=80)
+    windows = split_into_windows(text, window_chars=300, overlap_chars=80)
+    assert len(windows) > 1
+    covered = [False] * len(text)
+    for offset, window in windows:
+        assert text[offset:offset + len(window)] == window
+        assert len(window) <= 300
+        covered[offset:offset + len(window)] = [True] * len(window)
+    assert all(covered[i] for i, char in enumerate(text) if not char.isspace())
+    for (offset, window), (next_offset, _) in zip(windows, windows[1:]):
+        assert offset < next_offset
+        assert offset + len(window) - next_offset <= 80
+
+def test_sentence_longer_than_a_window_is_cut_at_whitespace():
+    text = " ".join(["metformin"] * 50)
+    windows = split_into_windows(text, window_chars=100, overlap_chars=20)
+    for offset, window in windows:
+        assert len(window) <= 100
+        assert not window.startswith(" ") and not window.endswith(" ")
+    assert " ".join(window for _, window in windows) == text
+
+def test_merge_maps_offsets_and_keeps_best_duplicate():
+    text = "Aspirin for chest pain. Metformin for diabetes."
+    windows = [(0, text[:23]), (12, text[12:])]
+    window_results = [
+        [{"start": 12, "end": 22, "text": "chest pain", "label": "symptom", "score": 0.6}],
+        [
+            {"start": 0, "end": 10, "text": "chest pain", "label": "symptom", "score": 0.8},
+            {"start": 12, "end": 21, "text": "Metformin", "label": "drug", "score": 0.9},
+        ],
+    ]
+    merged = merge_window_entities(windows, window_results, multi_label=False)
+    assert [(e["start"], e["end"], e["score"]) for e in merged] == [(12, 22, 0.8), (24, 33, 0.9)]
+    assert all(text[e["start"]:e["end"]] == e["text"] for e in merged)
+
+def test_entity_cut_at_a_window_edge_loses_to_the_whole_entity():
+    text = "History of heart failure and chest pain."
+    # The first window ends inside "heart failure", so it only sees the truncated "heart fai"
+    windows = [(0, text[:20]), (11, text[11:])]
+    window_results = [
+        [{"start": 11, "end": 20, "text": "heart fai", "label": "disease", "score": 0.4}],
+        [
+            {"start": 0, "end": 13, "text": "heart failure", "label": "disease", "score": 0.9},
+            {"start": 18, "end": 28, "text": "chest pain", "label": "symptom", "score": 0.7},
+        ],
+    ]
+    merged = merge_window_entities(windows, window_results, multi_label=False)
+    assert [text[e["start"]:e["end"]] for e in merged] == ["heart failure", "chest pain"]
+
+def test_missing_window_results_are_skipped():
+    windows = [(0, "Aspirin."), (9, "Aspirin.")]
+    window_results = [None, [{"start": 0, "end": 7, "text": "Aspirin", "label": "drug", "score": 0.9}]]
+    assert merge_window_entities(windows, window_results, multi_label=False)[0]["start"] == 9
+
+@pytest.mark.parametrize("seed", range(3))
+def test_windowed_prediction_matches_whole_text(seed):
+    texts = [clinical_text(seed, sentences=150), "Aspirin for chest pain."]
+    assert len(split_into_windows(texts[0])) > 1
+    expected = [[(e["start"], e["end"], e["label"]) for e in entities] for entities in asyncio.run(find_terms(texts))]
+    results = asyncio.run(predict_windowed(texts, find_terms, multi_label=False))
+    assert [[(e["start"], e["end"], e["label"]) for e in entities] for entities in results] == expected
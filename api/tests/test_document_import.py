@@ -0,0 +1,42 @@
+import csv
+import io
+import pytest
+import constants
+from document_import import parse_csv, parse_jsonl
+
+LIMIT = 50
+
+@pytest.fixture(autouse=True)
+def small_documents(monkeypatch):
+    monkeypatch.setattr(constants, "IMPORT_MAX_DOCUMENT_BYTES", LIMIT)
+    previous = csv.field_size_limit(LIMIT)
+    yield
+    csv.field_size_limit(previous)
+
+def parse(parser, content: str) -> list:
+    return [(row, fields["title"] if fields else None, error) for row, fields, error in parser(io.BytesIO(content.encode("utf-8")))]
+
+def test_csv_rejects_an_oversized_line_and_keeps_going():
+    rows = parse(parse_csv, "title,text\na,ok\nb,%s\nc,fine\n" % ("x" * 200))
+    assert [(row, title) for row, title, _ in rows] == [("row 1", "a"), ("row 2", None), ("row 3", "c")]
+    assert "longer than" in rows[1][2]
+
+def test_csv_skips_the_rest_of_an_oversized_quoted_field():
+    # The lines inside the rejected field must not come back as rows of their own
+    content = 'title,text\na,ok\nb,"%s\n%s\nx, y\n"\nc,fine\n' % ("z" * 30, "z" * 30)
+    rows = parse(parse_csv, content)
+    assert [(row, title) for row, title, _ in rows] == [("row 1", "a"), ("row 2", None), ("row 3", "c")]
+    assert "field limit" in rows[1][2]
+
+def test_csv_quoted_fields_with_quotes_and_newlines():
+    content = 'title,text\r\na,"he said ""hi"""\r\nb,"%s"\r\nc,"multi\r\nline, ok"\r\n' % ("x" * 200)
+    assert [(row, title) for row, title, _ in parse(parse_csv, content)] == [("row 1", "a"), ("row 2", None), ("row 3", "c")]
+
+def test_csv_document_over_the_byte_limit():
+    # Within the character limits of a line, but over the limit in UTF-8 bytes
+    rows = parse(parse_csv, "title,text\na,%s\n" % ("é" * 40))
+    assert rows == [("row 1", None, "Document too large")]
+
+def test_jsonl_rejects_oversized_lines():
+    content = '{"title": "a", "text": "ok"}\n{"title": "b", "text": "%s"}\n\n{"title": "c", "text": "fine"}' % ("x" * 200)
+    assert parse(parse_jsonl, content) == [("line 1", "a", None), ("line 2", None, "Document too large"), ("line 4", "c", None)]
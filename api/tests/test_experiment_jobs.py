@@ -0,0 +1,153 @@
+import asyncio
+from datetime import timedelta
+import pytest
+import constants
+import experiment_jobs
+import result_store
+from experiment_jobs import JOB_COMPLETED, JOB_QUEUED, JOB_RUNNING, ExperimentJobWorkers, InMemoryJobStore
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def make_stale(store: InMemoryJobStore, job_id: int):
+    """Age the job's heartbeat past JOB_STALE_SECONDS, as if its worker had died."""
+    store.jobs[job_id]["updated_at"] -= timedelta(seconds=constants.JOB_STALE_SECONDS + 1)
+
+def test_claim_respects_per_user_limit():
+    store = InMemoryJobStore()
+    first, second, third = (run(store.create(run_id, 1, "alice", 10)) for run_id in (1, 2, 3))
+    other = run(store.create(4, 1, "bob", 10))
+
+    claimed = [run(store.claim(per_user_limit=2)) for _ in range(4)]
+    assert [job["id"] if job else None for job in claimed] == [first["id"], second["id"], other["id"], None]
+    assert all(job["status"] == JOB_RUNNING and job["claim_token"] for job in claimed[:3])
+    assert store.jobs[third["id"]]["status"] == JOB_QUEUED
+
+    assert run(store.finish(first["id"], claimed[0]["claim_token"], JOB_COMPLETED))
+    assert run(store.claim(per_user_limit=2))["id"] == third["id"]
+
+def test_stale_job_does_not_count_against_the_limit():
+    store = InMemoryJobStore()
+    first = run(store.create(1, 1, "alice", 10))
+    second = run(store.create(2, 1, "alice", 10))
+    run(store.claim(per_user_limit=1))
+    assert run(store.claim(per_user_limit=1)) is None
+
+    make_stale(store, first["id"])
+    # The stale job itself is claimed again first, since it comes first
+    assert run(store.claim(per_user_limit=1))["id"] == first["id"]
+    assert run(store.claim(per_user_limit=1)) is None
+    assert store.jobs[second["id"]]["status"] == JOB_QUEUED
+
+def test_stale_job_resumes_from_its_checkpoint():
+    store = InMemoryJobStore()
+    job = run(store.create(1, 1, "alice", 10))
+    claimed = run(store.claim(per_user_limit=1))
+    assert run(store.checkpoint(job["id"], claimed["claim_token"], 4, 42))
+
+    make_stale(store, job["id"])
+    reclaimed = run(store.claim(per_user_limit=1))
+    assert reclaimed["id"] == job["id"]
+    assert (reclaimed["processed_documents"], reclaimed["last_document_id"]) == (4, 42)
+    assert reclaimed["claim_token"] != claimed["claim_token"]
+
+    # The worker that lost the job can no longer change it
+    assert not run(store.heartbeat(job["id"], claimed["claim_token"]))
+    assert not run(store.checkpoint(job["id"], claimed["claim_token"], 10, 99))
+    assert not run(store.finish(job["id"], claimed["claim_token"], JOB_COMPLETED))
+    assert store.jobs[job["id"]]["last_document_id"] == 42
+    assert run(store.finish(job["id"], reclaimed["claim_token"], JOB_COMPLETED))
+
+@pytest.fixture
+def fake_run(monkeypatch):
+    """Stands in for the run's documents (ids 10, 20, ... 100 in batches of two) and its stored results."""
+    calls = {"deleted_after": [], "batches_after": []}
+
+    async def get_run_details(run_id):
+        return {"id": run_id, "model": "m", "threshold": 0.5, "labels_to_extract": "drug", "allow_multilabeling": False}
+
+    async def run_document_batches(experiment_id, run, after_id=0, previous=None):
+        calls["batches_after"].append(after_id)
+        ids = [document_id for document_id in range(10, 101, 10) if document_id > after_id]
+        for i in range(0, len(ids), 2):
+            if calls.get("before_batch"):
+                calls["before_batch"]()
+            yield ids[i + 1], [{"document_id": document_id} for document_id in ids[i:i + 2]]
+
+    async def delete_results_after(run_id, document_id):
+        calls["deleted_after"].append(document_id)
+
+    async def migrate_legacy_results(run_ids):
+        pass
+
+    monkeypatch.setattr(experiment_jobs, "get_run_details", get_run_details)
+    monkeypatch.setattr(experiment_jobs, "run_document_batches", run_document_batches)
+    monkeypatch.setattr(result_store, "delete_results_after", delete_results_after)
+    monkeypatch.setattr(result_store, "migrate_legacy_results", migrate_legacy_results)
+    return calls
+
+def test_worker_resumes_after_the_checkpoint(fake_run):
+    store = InMemoryJobStore()
+    job = run(store.create(1, 1, "alice", 10))
+    claimed = run(store.claim(per_user_limit=1))
+    run(store.checkpoint(job["id"], claimed["claim_token"], 4, 40))
+    make_stale(store, job["id"])
+
+    run(ExperimentJobWorkers(store, num_workers=1).process(run(store.claim(per_user_limit=1))))
+
+    # Results stored after the checkpoint are dropped and predicted again
+    assert fake_run["deleted_after"] == [40] and fake_run["batches_after"] == [40]
+    finished = store.jobs[job["id"]]
+    assert (finished["status"], finished["processed_documents"], finished["last_document_id"]) == (JOB_COMPLETED, 10, 100)
+
+def test_worker_stops_once_another_worker_claims_the_job(fake_run):
+    store = InMemoryJobStore()
+    job = run(store.create(1, 1, "alice", 10))
+    claimed = run(store.claim(per_user_limit=1))
+
+    def reclaim():
+        # Another worker took over after the first batch was checkpointed
+        if store.jobs[job["id"]]["last_document_id"] == 20:
+            store.jobs[job["id"]]["claim_token"] = "other-worker"
+    fake_run["before_batch"] = reclaim
+
+    run(ExperimentJobWorkers(store, num_workers=1).process(claimed))
+
+    stopped = store.jobs[job["id"]]
+    assert (stopped["status"], stopped["processed_documents"], stopped["last_document_id"]) == (JOB_RUNNING, 2, 20)
+
+class FlakyJobStore(InMemoryJobStore):
+    """Fails every update of the first job, as during a database outage."""
+
+    async def checkpoint(self, job_id, claim_token, processed_documents, last_document_id):
+        if job_id == 1:
+            raise ConnectionError("database unavailable")
+        return await super().checkpoint(job_id, claim_token, processed_documents, last_document_id)
+
+    async def finish(self, job_id, claim_token, status, error=None):
+        if job_id == 1:
+            raise ConnectionError("database unavailable")
+        return await super().finish(job_id, claim_token, status, error)
+
+def test_worker_keeps_running_after_a_database_error(fake_run, monkeypatch):
+    monkeypatch.setattr(constants, "JOB_POLL_SECONDS", 0.01)
+    store = FlakyJobStore()
+    first = run(store.create(1, 1, "alice", 10))
+    second = run(store.create(2, 1, "bob", 10))
+
+    async def work_until_second_job_is_done():
+        workers = ExperimentJobWorkers(store, num_workers=1)
+        workers.start()
+        try:
+            for _ in range(500):
+                if store.jobs[second["id"]]["status"] == JOB_COMPLETED:
+                    break
+                await asyncio.sleep(0.01)
+            assert all(not task.done() for task in workers.tasks)
+        finally:
+            await workers.stop()
+
+    run(work_until_second_job_is_done())
+    assert store.jobs[second["id"]]["status"] == JOB_COMPLETED
+    # Left running, so it is claimed again once its heartbeat is stale
+    assert store.jobs[first["id"]]["status"] == JOB_RUNNING
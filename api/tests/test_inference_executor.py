@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from inference_executor import InferenceExecutor, wait_when_busy
+
+def blocking_call(release: threading.Event):
+    release.wait(5)
+    return "done"
+
+async def with_full_queue(executor: InferenceExecutor, check):
+    """Run check while the model's only queue slot is taken, then free the slot."""
+    release = threading.Event()
+    running = asyncio.create_task(executor.run("model", blocking_call, release))
+    await asyncio.sleep(0.01)
+    try:
+        return await check(release)
+    finally:
+        release.set()
+        await running
+        await executor.shutdown()
+
+def test_full_queue_rejects_interactive_requests():
+    async def check(release):
+        with pytest.raises(HTTPException) as error:
+            await executor.run("model", lambda: "done")
+        return error.value.status_code
+
+    executor = InferenceExecutor(workers_per_model=1, max_queue_size=1)
+    assert asyncio.run(with_full_queue(executor, check)) == 503
+
+def test_full_queue_makes_background_work_wait():
+    async def check(release):
+        async def background():
+            wait_when_busy.set(True)
+            return await executor.run("model", lambda: "done")
+
+        waiting = asyncio.create_task(background())
+        await asyncio.sleep(0.2)
+        assert not waiting.done()
+        release.set()
+        return await asyncio.wait_for(waiting, timeout=10)
+
+    executor = InferenceExecutor(workers_per_model=1, max_queue_size=1)
+    assert asyncio.run(with_full_queue(executor, check)) == "done"
+    # The flag was set in the background task's own context only
+    assert wait_when_busy.get() is False
+
+def test_background_work_stops_waiting_on_shutdown():
+    async def check(release):
+        async def background():
+            wait_when_busy.set(True)
+            return await executor.run("model", lambda: "done")
+
+        waiting = asyncio.create_task(background())
+        await asyncio.sleep(0.05)
+        executor.closed = True
+        with pytest.raises(HTTPException):
+            await asyncio.wait_for(waiting, timeout=10)
+
+    executor = InferenceExecutor(workers_per_model=1, max_queue_size=1)
+    asyncio.run(with_full_queue(executor, check))
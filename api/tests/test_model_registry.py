@@ -0,0 +1,64 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+from model_registry import MODEL_PATHS, ModelRegistry
+
+class FakeModel:
+    pass
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replaces loading from disk with a slow stand-in, recording each load and the resident models it saw."""
+    calls = []
+
+    def load(self, name, resident):
+        calls.append((name, len(resident)))
+        time.sleep(0.05)
+        return FakeModel()
+
+    monkeypatch.setattr(ModelRegistry, "load", load)
+    return calls
+
+def test_preload_skips_names_that_are_not_local_models(loads):
+    registry = ModelRegistry(memory_budget_mb=0)
+    name = next(iter(MODEL_PATHS))
+    asyncio.run(asyncio.wait_for(registry.preload(["gemini-2.5-flash", name]), timeout=5))
+    assert registry.ready
+    assert [loaded for loaded, _ in loads] == [name]
+
+def test_unknown_model_is_rejected(loads):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ModelRegistry(memory_budget_mb=0).get("unknown"))
+    assert error.value.status_code == 400 and loads == []
+
+def test_concurrent_first_requests_load_a_model_once(loads):
+    registry = ModelRegistry(memory_budget_mb=0)
+    name = next(iter(MODEL_PATHS))
+
+    async def get_concurrently():
+        return await asyncio.gather(*[registry.get(name) for _ in range(5)])
+
+    models = asyncio.run(get_concurrently())
+    assert len(loads) == 1
+    assert all(model is models[0] for model in models)
+    assert registry.models[name] is models[0] and registry.loading == {}
+
+def test_models_are_added_on_the_event_loop(loads):
+    registry = ModelRegistry(memory_budget_mb=0)
+    first, second = list(MODEL_PATHS)[:2]
+
+    async def load_both():
+        await registry.get(first)
+        # While the second model loads on a worker thread, the loop keeps using the registry
+        loading = asyncio.create_task(registry.get(second))
+        while not loading.done():
+            await registry.get(first)
+            registry.memory_bytes()
+            await asyncio.sleep(0.005)
+        return await loading
+
+    asyncio.run(load_both())
+    assert list(registry.models) == [first, second]
+    # The second load shared weights against a snapshot holding the first model
+    assert loads == [(first, 0), (second, 1)]
@@ -0,0 +1,77 @@
+import random
+import bson
+import pytest
+import constants
+from result_store import decode_predictions, decode_result, encode_predictions, encode_result
+
+LABELS = ["disease", "drug", "symptom", "procedure"]
+TEXTS = ["aspirin", "fièvre", "心筋梗塞", "naïve T-cell 🙂", ""]
+
+def random_predictions(seed: int, count: int) -> list:
+    rng = random.Random(seed)
+    return [
+        {"start": i * 10, "end": i * 10 + 7, "text": rng.choice(TEXTS), "label": rng.choice(LABELS), "score": rng.random()}
+        for i in range(count)
+    ]
+
+def assert_same_entities(decoded: list, predictions: list):
+    assert [{k: v for k, v in e.items() if k != "score"} for e in decoded] == [{k: v for k, v in e.items() if k != "score"} for e in predictions]
+    # Scores are stored as float16
+    assert all(abs(a["score"] - b["score"]) < 1e-3 for a, b in zip(decoded, predictions))
+
+def stored(record: dict) -> dict:
+    """The record as read back from Mongo."""
+    return bson.decode(bson.encode(record))
+
+@pytest.fixture(params=["zstd", "none"])
+def compression(request, monkeypatch):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(constants, "RESULTS_COMPRESSION", request.param)
+    return request.param
+
+def test_empty_predictions(compression):
+    record = stored(encode_predictions([]))
+    assert record["entity_count"] == 0 and record["labels"] == []
+    assert decode_predictions(record) == []
+    assert decode_predictions(record, "drug") == []
+
+def test_round_trip_with_non_ascii_text(compression):
+    predictions = random_predictions(0, 300)
+    record = encode_predictions(predictions)
+    assert record["compression"] == (None if compression == "none" else "zstd")
+    assert_same_entities(decode_predictions(stored(record)), predictions)
+
+def test_small_payload_is_not_compressed(compression):
+    predictions = random_predictions(1, 1)
+    record = encode_predictions(predictions)
+    assert record["compression"] is None
+    assert_same_entities(decode_predictions(stored(record)), predictions)
+
+def test_compression_threshold(monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(constants, "RESULTS_COMPRESSION", "zstd")
+    monkeypatch.setattr(constants, "RESULTS_COMPRESSION_MIN_BYTES", 0)
+    predictions = random_predictions(2, 3)
+    record = encode_predictions(predictions)
+    assert record["compression"] == "zstd"
+    assert_same_entities(decode_predictions(stored(record)), predictions)
+
+def test_label_filter(compression):
+    predictions = random_predictions(3, 100)
+    record = stored(encode_predictions(predictions))
+    for label in LABELS:
+        assert_same_entities(decode_predictions(record, label), [p for p in predictions if p["label"] == label])
+    assert decode_predictions(record, "unknown") == []
+
+def test_encode_result_round_trip(compression):
+    result = {"document_id": 7, "document_title": "Note", "text_hash": "abc", "predictions": random_predictions(4, 20)}
+    record = stored(encode_result(3, result))
+    assert record["experiment_run_id"] == 3
+    decoded = decode_result(record)
+    assert {k: decoded[k] for k in ("document_id", "document_title", "text_hash")} == {"document_id": 7, "document_title": "Note", "text_hash": "abc"}
+    assert_same_entities(decoded["predictions"], result["predictions"])
+
+def test_missing_predictions_are_stored_as_empty():
+    record = stored(encode_result(3, {"document_id": 1, "document_title": "Note", "predictions": None}))
+    assert decode_result(record)["predictions"] == [] and decode_result(record)["text_hash"] is None
@@ -0,0 +1,138 @@
+import asyncio
+import random
+import numpy as np
+import pytest
+import run_analytics
+from result_store import encode_result
+from run_analytics import compare_pair, load_run_columns, overlap_mask, summarize_run
+
+LABELS = ["disease", "drug", "symptom"]
+
+def random_entities(rng: random.Random, documents: list, per_document: int, base: int = 0) -> list:
+    """(document, start, end, label, score) tuples, with duplicated and overlapping spans."""
+    entities = []
+    for document in documents:
+        for _ in range(rng.randint(0, per_document)):
+            start = base + rng.randint(0, 60)
+            entities.append((document, start, start + rng.randint(1, 8), rng.choice(LABELS), rng.random()))
+    return entities
+
+def load_run(monkeypatch, run_id: int, documents: list, entities: list):
+    """The run's columns, loaded from records encoded the way they are stored."""
+    records = [
+        encode_result(run_id, {
+            "document_id": document,
+            "document_title": f"Document {document}",
+            "predictions": [
+                {"start": s, "end": e, "text": "x", "label": label, "score": score}
+                for d, s, e, label, score in entities if d == document
+            ],
+        })
+        for document in documents
+    ]
+
+    async def fetch_records():
+        for record in records:
+            yield record
+
+    async def no_legacy_results(run_ids):
+        pass
+
+    monkeypatch.setattr(run_analytics, "fetch_result_records", lambda run_ids: fetch_records())
+    monkeypatch.setattr(run_analytics, "migrate_legacy_results", no_legacy_results)
+    return asyncio.run(load_run_columns(run_id))
+
+def overlaps(span: tuple, others: set) -> bool:
+    document, start, end, label = span
+    return any(o[0] == document and o[3] == label and o[1] < end and o[2] > start for o in others)
+
+def ratio(numerator: int, denominator: int) -> float:
+    return round(numerator / denominator, 4) if denominator else 0.0
+
+def reference_comparison(first: list, first_documents: list, second: list, second_documents: list) -> dict:
+    """compare_pair's counts and scores computed span by span."""
+    common = set(first_documents) & set(second_documents)
+    a = {(d, s, e, label) for d, s, e, label, _ in first if d in common}
+    b = {(d, s, e, label) for d, s, e, label, _ in second if d in common}
+
+    def scores(x: set, y: set) -> dict:
+        exact = len(x & y)
+        overlap_x = sum(overlaps(span, y) for span in x)
+        overlap_y = sum(overlaps(span, x) for span in y)
+        return {
+            "first_entities": len(x),
+            "second_entities": len(y),
+            "exact_matches": exact,
+            "exact_precision": ratio(exact, len(y)),
+            "exact_recall": ratio(exact, len(x)),
+            "overlap_precision": ratio(overlap_y, len(y)),
+            "overlap_recall": ratio(overlap_x, len(x)),
+        }
+
+    labels = sorted({span[3] for span in a | b} | {e[3] for e in first + second})
+    return {
+        "common_documents": len(common),
+        "total": scores(a, b),
+        "labels": {label: scores({s for s in a if s[3] == label}, {s for s in b if s[3] == label}) for label in labels},
+    }
+
+def comparison_scores(item: dict) -> dict:
+    return {
+        "first_entities": item["first_entities"],
+        "second_entities": item["second_entities"],
+        "exact_matches": item["exact_matches"],
+        "exact_precision": item["exact"]["precision"],
+        "exact_recall": item["exact"]["recall"],
+        "overlap_precision": item["overlap"]["precision"],
+        "overlap_recall": item["overlap"]["recall"],
+    }
+
+@pytest.mark.parametrize("seed", range(10))
+def test_overlap_mask_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    num_labels, span_limit = 3, 40
+
+    def spans(count: int) -> dict:
+        start = rng.integers(0, 30, count)
+        return {"document": rng.integers(0, 4, count), "label": rng.integers(0, num_labels, count),
+                "start": start, "end": start + rng.integers(1, 10, count)}
+
+    x, y = spans(int(rng.integers(0, 60))), spans(int(rng.integers(0, 60)))
+    others = set(zip(y["document"].tolist(), y["start"].tolist(), y["end"].tolist(), y["label"].tolist()))
+    expected = [overlaps(span, others) for span in zip(x["document"].tolist(), x["start"].tolist(), x["end"].tolist(), x["label"].tolist())]
+    assert overlap_mask(x, y, num_labels, span_limit).tolist() == expected
+
+# A base offset near the int32 limit makes the packed span keys overflow int64, exercising the row fallback
+@pytest.mark.parametrize("base", [0, 2_000_000_000])
+@pytest.mark.parametrize("seed", range(5))
+def test_compare_pair_matches_brute_force(monkeypatch, seed, base):
+    rng = random.Random(seed)
+    first_documents, second_documents = list(range(1, 30)), list(range(10, 40))
+    first = random_entities(rng, first_documents, 8, base)
+    second = random_entities(rng, second_documents, 8, base)
+    # Share some spans exactly, so exact matches are not left to chance
+    second += [entity for entity in first if entity[0] >= 10 and rng.random() < 0.3]
+
+    result = compare_pair(load_run(monkeypatch, 1, first_documents, first), load_run(monkeypatch, 2, second_documents, second))
+    expected = reference_comparison(first, first_documents, second, second_documents)
+
+    assert result["run_ids"] == [1, 2]
+    assert result["common_documents"] == expected["common_documents"]
+    assert comparison_scores(result) == expected["total"]
+    assert {item["label"]: comparison_scores(item) for item in result["labels"]} == expected["labels"]
+
+def test_compare_pair_with_an_empty_run(monkeypatch):
+    first = random_entities(random.Random(0), [1, 2, 3], 5)
+    result = compare_pair(load_run(monkeypatch, 1, [1, 2, 3], first), load_run(monkeypatch, 2, [], []))
+    assert result["common_documents"] == 0
+    assert result["first_entities"] == result["second_entities"] == result["exact_matches"] == 0
+
+def test_summarize_run(monkeypatch):
+    entities = [(1, 0, 5, "drug", 0.95), (1, 10, 15, "drug", 0.15), (2, 3, 9, "disease", 0.55)]
+    summary = summarize_run(load_run(monkeypatch, 1, [1, 2, 3], entities))
+    assert (summary["documents"], summary["documents_with_entities"], summary["entities"]) == (3, 2, 3)
+    drug, disease = summary["labels"]
+    assert (drug["label"], drug["entities"], drug["documents"]) == ("drug", 2, 1)
+    assert drug["mean_score"] == pytest.approx(0.55, abs=1e-3)
+    assert drug["score_histogram"][9] == 1 and drug["score_histogram"][1] == 1
+    assert (disease["label"], disease["entities"], disease["documents"]) == ("disease", 1, 1)
@@ -0,0 +1,53 @@
+import random
+import numpy as np
+import pytest
+
+decoder = pytest.importorskip("gliner.decoding.decoder")
+
+from span_cache import decode_candidates, greedy_decode
+
+LABELS = ["disease", "drug", "symptom"]
+
+def random_token_spans(rng: random.Random, count: int, num_tokens: int = 30) -> list:
+    spans = []
+    for _ in range(count):
+        start = rng.randrange(num_tokens)
+        end = min(num_tokens - 1, start + rng.randrange(4))
+        spans.append(decoder.Span(start=start, end=end, entity_type=rng.choice(LABELS), score=rng.random()))
+    return spans
+
+def to_candidate(span) -> dict:
+    """The span as predict_entities reports it, for single-character tokens separated by spaces:
+    character offsets with an exclusive end, where GLiNER's decoder uses token offsets with an inclusive one."""
+    return {"start": 2 * span.start, "end": 2 * span.end + 1, "label": span.entity_type, "score": span.score}
+
+def greedy_search(spans: list, multi_label: bool) -> list:
+    return decoder.SpanDecoder.greedy_search(None, spans, flat_ner=True, multi_label=multi_label)
+
+@pytest.mark.parametrize("multi_label", [False, True])
+@pytest.mark.parametrize("seed", range(20))
+def test_greedy_decode_matches_gliner(seed, multi_label):
+    spans = random_token_spans(random.Random(seed), count=40)
+    expected = [to_candidate(span) for span in greedy_search(spans, multi_label)]
+    assert greedy_decode([to_candidate(span) for span in spans], multi_label) == expected
+
+@pytest.mark.parametrize("threshold", [0.1, 0.3, 0.5, 0.9])
+@pytest.mark.parametrize("multi_label", [False, True])
+def test_decode_candidates_matches_decoding_at_threshold(threshold, multi_label):
+    spans = random_token_spans(random.Random(7), count=60)
+    # GLiNER keeps the spans scoring above the threshold, then removes overlaps
+    expected = [to_candidate(span) for span in greedy_search([s for s in spans if s.score > threshold], multi_label)]
+    assert decode_candidates([to_candidate(span) for span in spans], threshold, multi_label) == expected
+
+def test_same_span_with_two_labels_kept_only_with_multi_label():
+    candidates = [
+        {"start": 0, "end": 7, "label": "drug", "score": 0.9},
+        {"start": 0, "end": 7, "label": "disease", "score": 0.8},
+    ]
+    assert [c["label"] for c in decode_candidates(candidates, 0.5, multi_label=False)] == ["drug"]
+    assert [c["label"] for c in decode_candidates(candidates, 0.5, multi_label=True)] == ["drug", "disease"]
+
+def test_threshold_compared_at_float32_precision():
+    # 0.3 as a float32 is slightly above 0.3, so a score equal to it is not above the threshold
+    candidates = [{"start": 0, "end": 3, "label": "drug", "score": float(np.float32(0.3))}]
+    assert decode_candidates(candidates, 0.3, multi_label=False) == []
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import date, timedelta
+import pytest
+import usage_meter
+from usage_meter import UsageMeter
+
+TODAY = date(2026, 1, 15)
+
+class FakeUsageTable:
+    """The daily usage rows, with the same semantics as the functions in daily_usage."""
+
+    def __init__(self):
+        self.counts = {}
+        self.loads = 0
+        self.writes = []
+        self.fail = False
+
+    async def get_user_usage(self, user_id, usage_date):
+        self.loads += 1
+        await asyncio.sleep(0)
+        return self.counts.get((user_id, usage_date), 0)
+
+    async def add_usage_deltas(self, deltas):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionError("Postgres is down")
+        self.writes.append(dict(deltas))
+        for key, delta in deltas.items():
+            self.counts[key] = max(0, self.counts.get(key, 0) + delta)
+        return {key: self.counts[key] for key in deltas}
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeUsageTable()
+    monkeypatch.setattr(usage_meter, "get_user_usage", table.get_user_usage)
+    monkeypatch.setattr(usage_meter, "add_usage_deltas", table.add_usage_deltas)
+    return table
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_reserve_stops_at_the_daily_limit(table):
+    meter = UsageMeter(tolerance=100, flush_seconds=60)
+    assert [run(meter.reserve("alice", 3, TODAY)) for _ in range(4)] == [1, 2, 3, None]
+    assert run(meter.usage("alice", TODAY)) == 3
+
+def test_stored_usage_counts_against_the_limit(table):
+    table.counts[("alice", TODAY)] = 8
+    meter = UsageMeter(tolerance=100, flush_seconds=60)
+    assert [run(meter.reserve("alice", 10, TODAY)) for _ in range(3)] == [9, 10, None]
+    assert run(meter.reserve("bob", 10, TODAY)) == 1
+
+def test_refund_frees_a_use_at_the_limit(table):
+    meter = UsageMeter(tolerance=100, flush_seconds=60)
+    for _ in range(2):
+        run(meter.reserve("alice", 2, TODAY))
+    assert run(meter.reserve("alice", 2, TODAY)) is None
+
+    run(meter.refund("alice", TODAY))
+    assert run(meter.usage("alice", TODAY)) == 1
+    assert run(meter.reserve("alice", 2, TODAY)) == 2
+    run(meter.flush())
+    assert table.counts[("alice", TODAY)] == 2
+
+def test_concurrent_reserves_admit_exactly_the_limit(table):
+    meter = UsageMeter(tolerance=3, flush_seconds=60)
+
+    async def reserve_many():
+        return await asyncio.gather(*[meter.reserve("alice", 10, TODAY) for _ in range(25)])
+
+    results = run(reserve_many())
+    assert sorted(result for result in results if result is not None) == list(range(1, 11))
+    assert results.count(None) == 15
+    # Concurrent first uses share one query for the stored count
+    assert table.loads == 1
+    run(meter.flush())
+    assert table.counts[("alice", TODAY)] == 10
+
+def test_pending_uses_past_the_tolerance_are_flushed(table):
+    meter = UsageMeter(tolerance=2, flush_seconds=60)
+    for _ in range(2):
+        run(meter.reserve("alice", 10, TODAY))
+    assert table.writes == []
+    run(meter.reserve("alice", 10, TODAY))
+    assert table.writes == [{("alice", TODAY): 3}]
+
+def test_failed_flush_keeps_the_pending_uses(table):
+    meter = UsageMeter(tolerance=100, flush_seconds=60)
+    for _ in range(3):
+        run(meter.reserve("alice", 10, TODAY))
+
+    table.fail = True
+    with pytest.raises(ConnectionError):
+        run(meter.flush())
+    assert run(meter.usage("alice", TODAY)) == 3
+
+    table.fail = False
+    run(meter.reserve("alice", 10, TODAY))
+    run(meter.flush())
+    assert table.counts[("alice", TODAY)] == 4
+    assert meter.pending == {} and meter.flushing == {}
+
+def test_flush_forgets_counters_of_past_days(table):
+    yesterday = date.today() - timedelta(days=1)
+    meter = UsageMeter(tolerance=100, flush_seconds=60)
+    run(meter.reserve("alice", 10, yesterday))
+    run(meter.reserve("alice", 10, date.today()))
+    run(meter.flush())
+    assert list(meter.stored) == [("alice", date.today())]
+    assert table.counts[("alice", yesterday)] == 1
+
+def test_reserve_succeeds_when_its_flush_fails(table):
+    meter = UsageMeter(tolerance=1, flush_seconds=60)
+    run(meter.reserve("alice", 10, TODAY))
+    table.fail = True
+    assert run(meter.reserve("alice", 10, TODAY)) == 2
+    assert run(meter.reserve("alice", 10, TODAY)) == 3
+
+    table.fail = False
+    run(meter.flush())
+    assert table.counts[("alice", TODAY)] == 3
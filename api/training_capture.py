@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import List
+from pymongo.errors import BulkWriteError
+import constants
+from helpers import get_text_hash
+from mongo import get_mongo_store
+
+DUPLICATE_KEY_ERROR = 11000
+
+class TrainingCapture:
+    """Collects texts users allowed for training and writes them to Mongo in the background.
+
+    Requests only enqueue the text. A background task writes batches with insert_many(ordered=False)
+    against a unique text_hash index, so texts stored before are rejected by the database instead of
+    being looked up first. The queue is bounded; when it is full, new texts are dropped rather than
+    slowing requests down.
+    """
+
+    def __init__(self, max_queue_size: int = constants.TRAINING_CAPTURE_QUEUE_SIZE, batch_size: int = constants.TRAINING_CAPTURE_BATCH_SIZE,
+                 flush_seconds: float = constants.TRAINING_CAPTURE_FLUSH_SECONDS):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.task = None
+        # Texts taken off the queue but not yet written, kept so stop() can still write them
+        self.batch: List[str] = []
+        self.dropped = 0
+
+    def submit(self, text: str):
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f"Training capture queue full, dropped {self.dropped} texts so far")
+
+    async def _write(self, texts: List[str]):
+        documents = {}
+        for text in texts:
+            documents.setdefault(get_text_hash(text), {"text": text, "text_hash": get_text_hash(text)})
+        try:
+            await get_mongo_store().training_texts().insert_many(list(documents.values()), ordered=False)
+        except BulkWriteError as e:
+            # Texts captured before are expected to be rejected by the unique index
+            other_errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY_ERROR]
+            if other_errors:
+                print(f"Failed to store {len(other_errors)} training texts: {other_errors[0].get('errmsg')}")
+        except Exception as e:
+            print(f"Failed to store {len(documents)} training texts: {e}")
+
+    async def _fill_batch(self):
+        """Wait for a text, then keep collecting until the batch is full or flush_seconds have passed."""
+        self.batch.append(await self.queue.get())
+        deadline = time.monotonic() + self.flush_seconds
+        while len(self.batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        while True:
+            await self._fill_batch()
+            await self._write(self.batch)
+            self.batch = []
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write whatever is still queued."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+        texts, self.batch = self.batch, []
+        while not self.queue.empty():
+            texts.append(self.queue.get_nowait())
+        for start in range(0, len(texts), self.batch_size):
+            await self._write(texts[start:start + self.batch_size])
+
+training_capture = None
+
+def get_training_capture() -> TrainingCapture:
+    global training_capture
+    if training_capture is None:
+        training_capture = TrainingCapture()
+    return training_capture
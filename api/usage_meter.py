@@ -0,0 +1,124 @@
+import asyncio
+from datetime import date
+from typing import Dict, Optional, Tuple
+import constants
+from daily_usage import get_user_usage, add_usage_deltas, reserve_user_usage, refund_user_usage
+
+UsageKey = Tuple[str, date]
+
+class UsageMeter:
+    """Per-user daily usage counters kept in process and written to Postgres in bulk.
+
+    A counter starts from the stored count and accumulates unflushed uses on top of it. Other
+    processes' uses only become visible at the next flush, so each process keeps at most
+    `tolerance` unflushed uses per user, which bounds its over-admission; going past that
+    flushes the user's counter right away, which also refreshes the stored count.
+    """
+
+    def __init__(self, tolerance: int = constants.USAGE_METER_TOLERANCE, flush_seconds: float = constants.USAGE_METER_FLUSH_SECONDS):
+        self.tolerance = tolerance
+        self.flush_seconds = flush_seconds
+        self.stored: Dict[UsageKey, int] = {}
+        self.pending: Dict[UsageKey, int] = {}
+        # Deltas taken out of pending by a flush that has not finished writing them yet
+        self.flushing: Dict[UsageKey, int] = {}
+        self.load_locks: Dict[UsageKey, asyncio.Lock] = {}
+
+    async def _load(self, key: UsageKey):
+        """Read a counter's stored count once; concurrent first uses of the same key share one query."""
+        if key in self.stored:
+            return
+        lock = self.load_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if key not in self.stored:
+                self.stored[key] = await get_user_usage(*key)
+        self.load_locks.pop(key, None)
+
+    def _used(self, key: UsageKey) -> int:
+        return self.stored[key] + self.flushing.get(key, 0) + self.pending.get(key, 0)
+
+    async def _flush(self, keys):
+        # Counters only change between awaits, so taking the deltas needs no lock; uses and refunds
+        # arriving while they are written go to pending again
+        deltas = {key: self.pending.pop(key) for key in keys if self.pending.get(key)}
+        if not deltas:
+            return
+        for key, delta in deltas.items():
+            self.flushing[key] = self.flushing.get(key, 0) + delta
+        try:
+            counts = await add_usage_deltas(deltas)
+        except Exception:
+            for key, delta in deltas.items():
+                self.pending[key] = self.pending.get(key, 0) + delta
+            raise
+        finally:
+            for key, delta in deltas.items():
+                self.flushing[key] -= delta
+                if not self.flushing[key]:
+                    del self.flushing[key]
+        self.stored.update(counts)
+
+    async def reserve(self, user_id: str, daily_limit: int, usage_date: date) -> Optional[int]:
+        """Count one use against the daily limit, returning the new count, or None when the limit is reached."""
+        key = (user_id, usage_date)
+        await self._load(key)
+        used = self._used(key)
+        if used >= daily_limit:
+            return None
+        self.pending[key] = self.pending.get(key, 0) + 1
+        if self.pending[key] > self.tolerance:
+            try:
+                await self._flush([key])
+            except Exception as e:
+                # The use is admitted and stays pending for the next flush; failing here would
+                # charge the user for a request that then errors without a refund
+                print(f"Error flushing usage counter, will retry: {e}")
+        return used + 1
+
+    async def refund(self, user_id: str, usage_date: date):
+        key = (user_id, usage_date)
+        self.pending[key] = self.pending.get(key, 0) - 1
+
+    async def usage(self, user_id: str, usage_date: date) -> int:
+        key = (user_id, usage_date)
+        await self._load(key)
+        return max(0, self._used(key))
+
+    async def flush(self):
+        """Write all pending deltas and forget counters of past days."""
+        await self._flush(list(self.pending))
+        today = date.today()
+        for key in [key for key in self.stored if key[1] < today and key not in self.pending and key not in self.flushing]:
+            del self.stored[key]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing usage counters, will retry: {e}")
+
+usage_meter = None
+
+def get_usage_meter() -> UsageMeter:
+    global usage_meter
+    if usage_meter is None:
+        usage_meter = UsageMeter()
+    return usage_meter
+
+async def reserve_usage(user_id: str, daily_limit: int, usage_date: date) -> Optional[int]:
+    if constants.USAGE_METER_ENABLED:
+        return await get_usage_meter().reserve(user_id, daily_limit, usage_date)
+    return await reserve_user_usage(user_id, daily_limit, usage_date)
+
+async def refund_usage(user_id: str, usage_date: date):
+    if constants.USAGE_METER_ENABLED:
+        await get_usage_meter().refund(user_id, usage_date)
+    else:
+        await refund_user_usage(user_id, usage_date)
+
+async def get_usage(user_id: str, usage_date: date) -> int:
+    if constants.USAGE_METER_ENABLED:
+        return await get_usage_meter().usage(user_id, usage_date)
+    return await get_user_usage(user_id, usage_date)
@@ -0,0 +1,79 @@
+"""Compare extract_entities_with_negatives against the original per-entity aligner on the generated data chunks.
+
+Usage:
+    python benchmark_alignment.py
+
+The tokenizer defaults to the backbone of urchade/gliner_small, the model used to generate the data;
+set TOKENIZER_NAME to use another. Both aligners must produce identical output.
+"""
+import glob
+import os
+import time
+from transformers import AutoTokenizer
+
+from data_processing import extract_entities_with_negatives, tokenize_text
+from helper_functions import load_json
+
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "microsoft/deberta-v3-small")
+DATA_FILES = "data_chunks/json_outputs*.json"
+
+
+def extract_entities_with_negatives_reference(tokenizer, data):
+    """The original aligner: re-tokenizes every entity and compares joined, lower-cased windows at each position."""
+    all_examples = []
+
+    for i, dt in enumerate(data):
+        try:
+            tokens = tokenize_text(tokenizer, dt['text'])
+            positive_ents = [(k["entity"], k["types"]) for k in dt['entities']]
+            negative_ents = [(k["entity"], k["types"]) for k in dt.get('negative_entities', [])]
+        except:
+            print(f"Problematic nested json: {i}, {dt}\n")
+            continue
+
+        positive_spans = []
+        for entity in positive_ents:
+            entity_tokens = tokenize_text(tokenizer, str(entity[0]))
+            for j in range(len(tokens) - len(entity_tokens) + 1):
+                if " ".join(tokens[j:j + len(entity_tokens)]).lower() == " ".join(entity_tokens).lower():
+                    for el in entity[1]:
+                        positive_spans.append((j, j + len(entity_tokens) - 1, el.lower().replace('_', ' ')))
+
+        negative_spans = []
+        for entity in negative_ents:
+            entity_tokens = tokenize_text(tokenizer, str(entity[0]))
+            for j in range(len(tokens) - len(entity_tokens) + 1):
+                if " ".join(tokens[j:j + len(entity_tokens)]).lower() == " ".join(entity_tokens).lower():
+                    for el in entity[1]:
+                        negative_spans.append((j, j + len(entity_tokens) - 1, el.lower().replace('_', ' ')))
+
+        all_examples.append({
+            "tokenized_text": tokens,
+            "ner": positive_spans,
+            "negative_ner": negative_spans
+        })
+
+    return all_examples
+
+
+def main():
+    tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+    data = []
+    for filename in sorted(glob.glob(DATA_FILES)):
+        data.extend(load_json(filename))
+    print(f"{len(data)} examples from {DATA_FILES}")
+
+    start = time.perf_counter()
+    expected = extract_entities_with_negatives_reference(tokenizer, data)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = extract_entities_with_negatives(tokenizer, data)
+    seconds = time.perf_counter() - start
+
+    assert actual == expected, "Aligned spans differ from the reference aligner"
+    print(f"reference: {reference_seconds:.2f}s  vectorized: {seconds:.2f}s  speedup: {reference_seconds / seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
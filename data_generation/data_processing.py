@@ -57,6 +57,24 @@ def tokenize_text(tokenizer, text):
     return stripped_tokens
 
 
+def tokenize_texts(tokenizer, texts):
+    """Tokenize several texts in one tokenizer call, giving the same tokens as tokenize_text would for each."""
+    if not texts:
+        return []
+    encoding = tokenizer(
+        texts,
+        add_special_tokens=False,
+        return_attention_mask=False,
+        return_offsets_mapping=False,
+        truncation=True,
+    )
+    try:
+        all_tokens = [encoding.tokens(i) for i in range(len(texts))]
+    except:
+        all_tokens = [tokenizer.tokenize(text) for text in texts]
+    return [[tok.lstrip("▁") for tok in tokens] for tokens in all_tokens]
+
+
 def process_response(response, text_content):
     response = response.replace("```json", "").replace("```", "").strip()
     match = re.search(r"<start>(.*?)<end>", response, re.DOTALL)
@@ -78,8 +96,37 @@ def process_response(response, text_content):
         return None
 
 
+def find_entity_spans(tokens, lowered_tokens, token_positions, entities, entity_tokens):
+    """Spans (start, end, label) of every occurrence of each entity's tokens in the text, compared case-insensitively.
+
+    token_positions maps each lower-cased token to the positions where it occurs, so only positions starting
+    with an entity's first token are checked. Without it (tokens containing spaces, where different token
+    sequences can join to the same string), windows are compared as joined strings.
+    """
+    spans = []
+    for entity, types in entities:
+        target = entity_tokens[str(entity)]
+        length = len(target)
+        if token_positions is None:
+            joined_target = " ".join(target).lower()
+            matches = [j for j in range(len(tokens) - length + 1) if " ".join(tokens[j:j + length]).lower() == joined_target]
+        elif length == 0:
+            # An empty entity matches at every position, like the joined-string comparison does
+            matches = range(len(tokens) + 1)
+        else:
+            lowered_target = [token.lower() for token in target]
+            matches = [j for j in token_positions.get(lowered_target[0], ()) if lowered_tokens[j:j + length] == lowered_target]
+
+        if matches:
+            labels = [el.lower().replace('_', ' ') for el in types]
+            for j in matches:
+                for label in labels:
+                    spans.append((j, j + length - 1, label))
+    return spans
+
+
 def extract_entities_with_negatives(tokenizer, data):
-    all_examples = []
+    examples = []
 
     for i, dt in enumerate(data):
         try:
@@ -89,27 +136,25 @@ def extract_entities_with_negatives(tokenizer, data):
         except:
             print(f"Problematic nested json: {i}, {dt}\n")
             continue
+        examples.append((tokens, positive_ents, negative_ents))
+
+    # Each distinct entity string is tokenized once, all in a single tokenizer call
+    entity_strings = list(dict.fromkeys(str(entity[0]) for _, positive_ents, negative_ents in examples for entity in positive_ents + negative_ents))
+    entity_tokens = dict(zip(entity_strings, tokenize_texts(tokenizer, entity_strings)))
 
-        positive_spans = []
-        for entity in positive_ents:
-            entity_tokens = tokenize_text(tokenizer, str(entity[0]))
-            for j in range(len(tokens) - len(entity_tokens) + 1):
-                if " ".join(tokens[j:j + len(entity_tokens)]).lower() == " ".join(entity_tokens).lower():
-                    for el in entity[1]:
-                        positive_spans.append((j, j + len(entity_tokens) - 1, el.lower().replace('_', ' ')))
-
-        negative_spans = []
-        for entity in negative_ents:
-            entity_tokens = tokenize_text(tokenizer, str(entity[0]))
-            for j in range(len(tokens) - len(entity_tokens) + 1):
-                if " ".join(tokens[j:j + len(entity_tokens)]).lower() == " ".join(entity_tokens).lower():
-                    for el in entity[1]:
-                        negative_spans.append((j, j + len(entity_tokens) - 1, el.lower().replace('_', ' ')))
+    all_examples = []
+    for tokens, positive_ents, negative_ents in examples:
+        lowered_tokens = [token.lower() for token in tokens]
+        token_positions = None
+        if not any(" " in token for token in tokens):
+            token_positions = {}
+            for j, token in enumerate(lowered_tokens):
+                token_positions.setdefault(token, []).append(j)
 
         all_examples.append({
             "tokenized_text": tokens,
-            "ner": positive_spans,
-            "negative_ner": negative_spans
+            "ner": find_entity_spans(tokens, lowered_tokens, token_positions, positive_ents, entity_tokens),
+            "negative_ner": find_entity_spans(tokens, lowered_tokens, token_positions, negative_ents, entity_tokens)
         })
 
     return all_examples